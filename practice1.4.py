@@ -1,35 +1,889 @@
-import tkinter as tk
-from tkinter import scrolledtext
 import sys
 import os
-import xml.etree.ElementTree as ET
-import base64
-from pathlib import Path
+import posixpath
 import time
 import re
-import shutil
+import threading
+import bisect
+import itertools
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
 
+# Тяжелые модули (tkinter, xml.etree, asyncio, json, zlib/lzma, base64,
+# tracemalloc) импортируются при первом использовании: они не нужны
+# до появления приглашения или нужны только отдельным режимам
+
+
+class _NullSpan:
+    """Пустой интервал: трассировка выключена, вход и выход ничего не делают"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        self.tracer.emit({
+            'name': self.name,
+            'cat': self.cat,
+            'ph': 'X',
+            'ts': (self.start - self.tracer.origin) / 1000,
+            'dur': (end - self.start) / 1000,
+            'pid': self.tracer.pid,
+            'tid': threading.get_ident(),
+            'args': self.args,
+        })
+        return False
+
+
+class Tracer:
+    """Запись событий в формате Chrome Trace (JSON-массив, chrome://tracing, Perfetto)
+
+    Пока трассировка выключена, span() возвращает общий NULL_SPAN,
+    поэтому инструментированный код почти ничего не теряет.
+    """
 
-class VFS:
     def __init__(self):
-        self.root = {'type': 'directory', 'name': '', 'children': {}}
-        self.current_path = Path('/')
+        self.enabled = False
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self._file = None
+        self._separator = ''
+        self._lock = threading.Lock()
+
+    def start(self, path):
+        import atexit
+        import json
+
+        self._dumps = json.dumps
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write('[')
+        self._separator = '\n'
+        self.origin = time.perf_counter_ns()
+        self.enabled = True
+        self.emit({'name': 'process_name', 'ph': 'M', 'pid': self.pid,
+                   'args': {'name': 'MyVFS Emulator'}})
+        atexit.register(self.stop)
+
+    def span(self, name, cat='vfs', **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    def emit(self, event):
+        line = self._dumps(event, ensure_ascii=False)
+        with self._lock:
+            if self._file:
+                self._file.write(self._separator + line)
+                self._separator = ',\n'
+
+    def stop(self):
+        with self._lock:
+            if not self._file:
+                return
+            self.enabled = False
+            # Просмотрщики допускают и незакрытый массив, но закрываем аккуратно
+            self._file.write('\n]\n')
+            self._file.close()
+            self._file = None
+
+
+TRACER = Tracer()
+
+
+class SessionRecorder:
+    """Журнал команд всех сеансов для воспроизведения (vfs_replay.py)
+
+    Первая строка - заголовок с временем начала и путем образа, далее по
+    строке на команду: смещение начала от старта записи и длительность в
+    микросекундах, номер сеанса и сама команда через табуляцию.
+    Пока запись выключена, сеансы не обращаются к журналу.
+    """
+
+    HEADER = '# vfs-session 1'
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def start(self, path, vfs_path=None):
+        import atexit
+
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write(f"{self.HEADER}\t{time.strftime('%Y-%m-%dT%H:%M:%S')}\t{vfs_path or ''}\n")
+        self.origin = time.perf_counter_ns()
+        self.enabled = True
+        atexit.register(self.stop)
+
+    def record(self, session_id, command, start_ns, end_ns):
+        # Табуляция внутри команды - просто разделитель аргументов
+        line = (f"{(start_ns - self.origin) // 1000}\t{(end_ns - start_ns) // 1000}\t"
+                f"{session_id}\t{command.replace(chr(9), ' ')}\n")
+        with self._lock:
+            if self._file:
+                self._file.write(line)
+
+    def stop(self):
+        with self._lock:
+            if not self._file:
+                return
+            self.enabled = False
+            self._file.close()
+            self._file = None
+
+
+RECORDER = SessionRecorder()
+
+
+class RWLock:
+    """Блокировка читатели/писатель: чтения параллельно, запись монопольно
+
+    Ожидающий писатель блокирует новых читателей, чтобы поток команд
+    чтения не откладывал изменения бесконечно.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+# Кодеки сжатия содержимого файлов: имя -> модуль с compress/decompress
+CONTENT_CODECS = {
+    'zlib': 'zlib',
+    'lzma': 'lzma',
+}
+
+
+class HostFile:
+    """Отложенное содержимое файла, импортированного с хоста (import --lazy-above)
+
+    Хранится вместо содержимого с кодеком 'host': "распаковка" - чтение
+    файла хоста (или участка tar-архива) через тот же LRU, что и для сжатия.
+    """
+
+    __slots__ = ('path', 'offset', 'size')
+
+    def __init__(self, path, offset=0, size=None):
+        self.path = path
+        self.offset = offset
+        self.size = size
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            if self.offset:
+                f.seek(self.offset)
+            return f.read() if self.size is None else f.read(self.size)
+
+    def __len__(self):
+        # Объем на хосте: для оценок вроде разбиения grep -r на части
+        return self.size or 0
+
+    def read_range(self, start, end):
+        """Байты [start, end) содержимого без чтения остального файла"""
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset + start)
+            return f.read(end - start)
+
+    def newlines(self):
+        """Позиции переводов строк; файл читается порциями, а не целиком"""
+        positions = array('Q')
+        remaining = self.size
+        base = 0
+        with open(self.path, 'rb') as f:
+            if self.offset:
+                f.seek(self.offset)
+            while remaining is None or remaining > 0:
+                chunk = f.read(LINE_SCAN_CHUNK if remaining is None else min(LINE_SCAN_CHUNK, remaining))
+                if not chunk:
+                    break
+                positions.fromlist([match.start() + base for match in NEWLINE_BYTES_RE.finditer(chunk)])
+                base += len(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+        return positions
+
+    @staticmethod
+    def decompress(source):
+        # Непредставимые в UTF-8 байты заменяются, как и при обычном импорте
+        return source.read().decode('utf-8', 'replace').encode('utf-8')
+
+
+def content_codec(name):
+    """Модуль кодека; импортируется только при включенном сжатии"""
+    if name == 'host':
+        return HostFile
+    return __import__(CONTENT_CODECS[name])
+
+
+class ContentCache:
+    """LRU распакованного содержимого с ограничением по суммарному размеру
+
+    Ключ - id сжатых данных (копии cp разделяют их), поэтому запись
+    хранит и сами данные для проверки, что id не переиспользован.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, data, codec):
+        key = id(data)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is data:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        text = content_codec(codec).decompress(data).decode('utf-8')
+
+        with self._lock:
+            self.misses += 1
+            if len(text) <= self.max_size:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self.size -= len(old[1])
+                self._entries[key] = (data, text)
+                self.size += len(text)
+                while self.size > self.max_size:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return text
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+# Переводы строк для индекса строк (head, tail, sed -n, wc -l)
+NEWLINE_RE = re.compile('\n')
+NEWLINE_BYTES_RE = re.compile(b'\n')
+# Порция чтения файла хоста при построении индекса строк
+LINE_SCAN_CHUNK = 1 << 20
+
+
+class LineIndex:
+    """Позиции переводов строк по содержимому файлов
+
+    Ключ - id содержимого, как в ContentCache: копии cp разделяют и
+    индекс, а запись хранит само содержимое для проверки, что id не
+    переиспользован. Позиции - array('Q') (байты для файлов хоста,
+    символы для остальных); строится одним проходом поиска '\n' без
+    разбиения содержимого на строки и дальше только читается.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        # Подписан ли владелец на изменения содержимого
+        self.watched = False
+
+    def get(self, content):
+        entry = self._entries.get(id(content))
+        if entry is not None and entry[0] is content:
+            return entry[1]
+        return None
+
+    def put(self, content, newlines):
+        """Сохранить позиции; True - пора подписаться на изменения содержимого"""
+        with self._lock:
+            self._entries[id(content)] = (content, newlines)
+            first, self.watched = not self.watched, True
+            return first
+
+    def discard(self, content):
+        with self._lock:
+            entry = self._entries.get(id(content))
+            if entry is not None and entry[0] is content:
+                del self._entries[id(content)]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.watched = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def memory(self):
+        return sum(newlines.itemsize * len(newlines) for _, newlines in self._entries.values())
+
+
+# Слова для полнотекстового индекса
+TOKEN_RE = re.compile(r'\w+')
+
+
+class TextIndex:
+    """Инвертированный индекс по содержимому файлов с позициями слов
+
+    Документ индекса - объект содержимого, а не файл: копии cp разделяют
+    содержимое, поэтому копирование не требует повторной токенизации,
+    а mv не меняет индекс вовсе (путь вычисляется по ссылкам на родителя).
+    """
+
+    def __init__(self, read_content):
+        self.read_content = read_content
+        # слово -> {ключ документа: позиции слова в документе}
+        self.postings = {}
+        # ключ документа -> [содержимое, {id узла: узел файла}, слова документа]
+        self.documents = {}
+
+    def add_file(self, node):
+        content = node['content']
+        key = id(content)
+        document = self.documents.get(key)
+        if document is None:
+            positions = {}
+            for position, match in enumerate(TOKEN_RE.finditer(self.read_content(node))):
+                token = match.group().lower()
+                token_positions = positions.get(token)
+                if token_positions is None:
+                    token_positions = positions[token] = array('I')
+                token_positions.append(position)
+            for token, token_positions in positions.items():
+                self.postings.setdefault(token, {})[key] = token_positions
+            # Ссылка на содержимое не дает переиспользовать id как ключ
+            document = self.documents[key] = [content, {}, list(positions)]
+        document[1][id(node)] = node
+
+    def remove_file(self, node, content=None):
+        """content - прежнее содержимое, если узел уже получил новое"""
+        key = id(node['content'] if content is None else content)
+        document = self.documents.get(key)
+        if document is None:
+            return
+        document[1].pop(id(node), None)
+        if document[1]:
+            return
+        del self.documents[key]
+        for token in document[2]:
+            documents = self.postings[token]
+            del documents[key]
+            if not documents:
+                del self.postings[token]
+
+    def add_tree(self, node):
+        for file_node in iter_files(node):
+            self.add_file(file_node)
+
+    def remove_tree(self, node):
+        for file_node in iter_files(node):
+            self.remove_file(file_node)
+
+    def match(self, tokens, phrase=False):
+        """Ключи документов со всеми словами (для phrase - подряд)
+
+        Пересечение начинается с самого короткого списка, поэтому время
+        зависит от числа совпадений, а не от объема содержимого.
+        """
+        lists = [self.postings.get(token) for token in tokens]
+        if not tokens or not all(lists):
+            return []
+        by_length = sorted(lists, key=len)
+        keys = [key for key in by_length[0] if all(key in other for other in by_length[1:])]
+        if phrase and len(tokens) > 1:
+            keys = [key for key in keys if self._has_phrase(key, lists)]
+        return keys
+
+    def match_parts(self, tokens):
+        """Ключи документов, где каждое слово входит хотя бы в одно слово документа
+
+        Для поиска подстроки: слово шаблона может оказаться частью более
+        длинного слова текста, поэтому просматривается словарь индекса.
+        """
+        keys = None
+        for token in sorted(set(tokens), key=len, reverse=True):
+            found = set()
+            for word, documents in self.postings.items():
+                if token in word:
+                    found.update(documents)
+            keys = found if keys is None else keys & found
+            if not keys:
+                return []
+        return list(keys)
+
+    @staticmethod
+    def _has_phrase(key, lists):
+        following = [set(documents[key]) for documents in lists[1:]]
+        return any(all(start + offset in positions for offset, positions in enumerate(following, 1))
+                   for start in lists[0][key])
+
+    def files(self, keys):
+        for key in keys:
+            yield from self.documents[key][1].values()
+
+
+def prefix_range(names, prefix):
+    """Диапазон [low, high) имен с префиксом prefix в отсортированном списке"""
+    low = bisect.bisect_left(names, prefix)
+    if not prefix:
+        return low, len(names)
+    # Наименьшая строка больше всех строк с этим префиксом
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return low, bisect.bisect_left(names, upper, low)
+
+
+def iter_directories(node):
+    """Все узлы директорий поддерева, включая сам node"""
+    stack = [node] if node['type'] == 'directory' else []
+    while stack:
+        current = stack.pop()
+        yield current
+        stack.extend(child for child in current['children'].values() if child['type'] == 'directory')
+
+
+def iter_files(node):
+    """Все узлы файлов поддерева (без разворачивания ленивых заглушек)"""
+    if node['type'] == 'file':
+        yield node
+        return
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        for child in current['children'].values():
+            if child['type'] == 'file':
+                yield child
+            else:
+                stack.append(child)
+
+
+# grep -r: меньше этого объема содержимого сканируем в текущем процессе
+GREP_PARALLEL_MIN = 8 * 1024 * 1024
+
+# Символы, которые XML 1.0 не передает как есть (включая \r - он нормализуется
+# при разборе): содержимое с ними экспортируется в base64
+XML_UNSAFE_RE = re.compile('[^\t\n\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]')
+
+# Символы шаблона имени для подстановки (glob)
+GLOB_CHARS_RE = re.compile(r'[*?\[]')
+
+# import: файлов в одной задаче пула потоков чтения
+IMPORT_BATCH = 64
+
+# Задание grep -r для процессов пула: наследуется при fork, а не передается
+_GREP_JOB = None
+_GREP_LOCK = threading.Lock()
+
+
+def grep_entry(pattern, mode, entry):
+    """Поиск в одном файле; entry = (путь, содержимое, кодек). Вывод или None"""
+    path, data, codec = entry
+    text = content_codec(codec).decompress(data).decode('utf-8') if codec else data
+
+    if mode == 'l':
+        # Достаточно первого совпадения
+        return path if pattern.search(text) else None
+
+    lines = []
+    count = 0
+    line_end = -1
+    for match in pattern.finditer(text):
+        if match.start() <= line_end:
+            # Совпадение в уже учтенной строке
+            continue
+        line_start = text.rfind('\n', 0, match.start()) + 1
+        line_end = text.find('\n', match.start())
+        if line_end == -1:
+            line_end = len(text)
+        count += 1
+        if mode != 'c':
+            lines.append(f"{path}:{text[line_start:line_end]}")
+
+    if mode == 'c':
+        return f"{path}:{count}"
+    return "\n".join(lines) if lines else None
+
+
+def _grep_worker(bounds):
+    pattern, mode, entries = _GREP_JOB
+    return [grep_entry(pattern, mode, entries[i]) for i in range(*bounds)]
+
+
+def _grep_chunks(entries, parts):
+    """Разбить список файлов на непрерывные диапазоны примерно равного объема"""
+    total = sum(len(data) for _, data, _ in entries)
+    target = max(1, total // parts)
+    chunks = []
+    start = size = 0
+    for i, (_, data, _) in enumerate(entries):
+        size += len(data)
+        if size >= target:
+            chunks.append((start, i + 1))
+            start = i + 1
+            size = 0
+    if start < len(entries):
+        chunks.append((start, len(entries)))
+    return chunks
+
+
+# Загрузка XML: меньший образ без явного --load-workers разбирается в текущем процессе
+LOAD_PARALLEL_MIN = 8 * 1024 * 1024
+
+# Задание параллельной загрузки для процессов пула: наследуется при fork
+_LOAD_JOB = None
+_LOAD_LOCK = threading.Lock()
+
+
+@contextmanager
+def gc_paused():
+    """Построение дерева без циклического сборщика: узлы остаются жить,
+    а его проходы по растущему дереву занимают до половины времени загрузки"""
+    import gc
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# Пролог документа (BOM, объявление XML, комментарии, инструкции, DOCTYPE с
+# внутренними объявлениями) и открывающий тег корня: имя и признак пустого тега
+XML_ROOT_RE = re.compile(
+    rb'(?:\xef\xbb\xbf)?(?:\s+|<\?.*?\?>|<!--.*?-->|<!DOCTYPE(?:[^\[>]|\[.*?\])*>)*'
+    rb'<([\w:.-]+)(?:[^>"\']|"[^"]*"|\'[^\']*\')*?(/?)>', re.S)
+
+
+def xml_fragment_prefix(source):
+    """Начало документа для участка образа: исходный пролог (кодировка,
+    объявления сущностей) и открывающий тег корня с его атрибутами"""
+    match = XML_ROOT_RE.match(source)
+    if match is None or match.group(2):
+        return b'<vfs>'
+    return source[:match.end()]
+
+
+def _load_shard(bounds):
+    """Разобрать участок верхнего уровня образа в процессе пула
+
+    Возвращает временный корень с готовыми узлами (ссылки на родителя,
+    агрегаты, 'order'); пул передает его через pickle, который сохраняет
+    и циклические ссылки, и общие объекты имен.
+    """
+    import xml.etree.ElementTree as ET
+
+    source, prefix, compression, compress_min = _LOAD_JOB
+    start, end = bounds
+    vfs = VFS(compression=compression, compress_min=compress_min)
+    with gc_paused():
+        element = ET.fromstring(prefix + source[start:end] + b'</vfs>')
+        vfs._parse_xml_element(element, vfs.root)
+    return vfs.root
+
+
+# Адрес sed -n: N, A,B или A,$ с командой p
+SED_RANGE_RE = re.compile(r'(\d+)(?:,(\d+|\$))?p')
+
+# Открывающий, закрывающий или пустой тег <directory> (значения атрибутов могут содержать '>')
+DIRECTORY_TAG_RE = re.compile(rb'<(/?)directory\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*?(/?)>')
+
+
+class ChangeBus:
+    """Уведомления об изменениях дерева для производных структур (индексы и т.п.)
+
+    Событие - кортеж (вид, узел, подробности):
+      ('create', node, None)            узел с поддеревом добавлен в дерево
+      ('delete', node, (parent, name))  узел удален из parent, где был под именем name
+      ('move', node, (parent, name))    узел перенесен из parent/name в node['parent']/node['name']
+      ('modify', node, old_content)     содержимое файла заменено
+      ('expand', node, None)            развернута заглушка ленивой загрузки
+      ('reset', None, None)             дерево заменено целиком
+    Подписчик получает список событий. Вне пакета и без подписчиков
+    publish сразу возвращается. В пакете (batch, begin/end) события
+    копятся и сливаются по узлу: созданный и затем удаленный узел не
+    виден вовсе, удаление с повторным добавлением - это перенос, цепочка
+    переносов - один перенос, замены содержимого - одна.
+    """
+
+    def __init__(self):
+        self.subscribers = []
+        self.depth = 0
+        # id узла -> [узел, вид, (родитель, имя) до пакета, содержимое до пакета, изменено ли]
+        self._pending = {}
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def notify(self, events):
+        """Доставить события подписчикам сразу, минуя пакет"""
+        for callback in list(self.subscribers):
+            callback(events)
+
+    def publish(self, kind, node, detail=None):
+        if kind == 'reset':
+            self._pending = {}
+            self.notify([(kind, node, detail)])
+        elif kind == 'expand':
+            # Развертывание не откатывается, поэтому не откладывается; поддерево
+            # узла, созданного в пакете, подписчики получат вместе с ним
+            if not self._created_ancestor(node):
+                self.notify([(kind, node, detail)])
+        elif self.depth:
+            self._merge(kind, node, detail)
+        elif self.subscribers:
+            self.notify([(kind, node, detail)])
+
+    def _created_ancestor(self, node):
+        """Узел или его предок добавлен в текущем пакете (подписчики его еще не видели)"""
+        pending = self._pending
+        while pending and node is not None:
+            entry = pending.get(id(node))
+            if entry is not None and entry[1] == 'create':
+                return True
+            node = node['parent']
+        return False
+
+    def _merge(self, kind, node, detail):
+        entry = self._pending.get(id(node))
+        if kind == 'modify':
+            if entry is None:
+                self._pending[id(node)] = [node, None, None, detail, True]
+            elif entry[1] != 'create' and not entry[4]:
+                entry[3] = detail
+                entry[4] = True
+            return
+
+        if entry is None:
+            if kind == 'delete' and self._created_ancestor(detail[0]):
+                # Узел из еще не доставленного поддерева: подписчики его не видели
+                kind = 'create'
+                entry = self._pending[id(node)] = [node, 'create', None, None, False]
+            else:
+                self._pending[id(node)] = [node, kind, detail, None, False]
+                return
+
+        previous = entry[1]
+        if previous is None:
+            entry[1] = kind
+            entry[2] = detail
+        elif previous == 'create' and kind == 'delete':
+            del self._pending[id(node)]
+        elif previous == 'move' and kind == 'delete':
+            entry[1] = 'delete'
+        elif previous == 'delete' and kind == 'create':
+            # Удаленный узел вернулся в дерево: для подписчиков это перенос
+            entry[1] = 'move'
+
+    def flush(self):
+        """Доставить слитые события пакета и вернуть их; пакет остается открытым"""
+        events = []
+        for node, kind, origin, old_content, modified in self._pending.values():
+            if modified and kind != 'create':
+                events.append(('modify', node, old_content))
+            if kind == 'move' and origin[0] is node['parent'] and origin[1] == node['name']:
+                continue
+            if kind is not None:
+                events.append((kind, node, origin))
+        self._pending = {}
+        if events:
+            self.notify(events)
+        return events
+
+    def discard(self):
+        """Отбросить накопленные события пакета (изменения отменены)"""
+        self._pending = {}
+
+    def begin(self):
+        self.depth += 1
+
+    def end(self):
+        """Закрыть пакет; внешний пакет доставляет накопленное"""
+        self.depth -= 1
+        if not self.depth:
+            return self.flush()
+        return []
+
+    @contextmanager
+    def batch(self):
+        self.begin()
+        try:
+            yield
+        finally:
+            self.end()
+
+
+class Transaction:
+    """Состояние begin/commit/rollback одного сеанса
+
+    Агрегаты не обновляются по ходу транзакции: изменения копятся по
+    директориям (deltas) и применяются одним проходом. Транзакция - пакет
+    шины изменений, поэтому подписчики получают слитые события при commit.
+    Журнал хранит структурные изменения и доставленные события для отмены
+    в обратном порядке.
+    """
+
+    def __init__(self, owner=None):
+        self.owner = owner
+        self.journal = []
+        # id директории -> [директория, байты, файлы, директории]
+        self.deltas = {}
+        self.operations = 0
+        # Текст ошибки, из-за которой транзакция отменена
+        self.failed = None
+
+
+class VFS:
+    def __init__(self, lazy_depth=None, compression=None, compress_min=4096, cache_size=16 * 1024 * 1024,
+                 load_workers=None):
+        self.root = self._new_directory('')
+        # Текущая директория своя у каждого потока, дерево - общее
+        self._local = threading.local()
+        self.current_path = '/'
+        self.lock = RWLock()
+        # Ленивая загрузка: директории глубже lazy_depth остаются заглушками
+        # до первого обращения
+        self.lazy_depth = lazy_depth
+        self.lazy_stubs = 0
+        self._lazy_source = None
+        self._materialize_lock = threading.Lock()
+        # Процессов параллельной загрузки XML; None - по числу ядер для крупных образов
+        self.load_workers = load_workers
+        # Сжатие содержимого файлов от compress_min символов; недавно
+        # прочитанное хранится распакованным в content_cache
+        if compression is not None and compression not in CONTENT_CODECS:
+            raise ValueError(f"Неизвестный кодек сжатия: {compression}")
+        self.compression = compression
+        self.compress_min = compress_min
+        self.content_cache = ContentCache(cache_size)
+        # Изменения дерева для подписчиков (индекс и другие производные структуры)
+        self.events = ChangeBus()
+        # Позиции строк файлов для head/tail/sed -n/wc -l, строятся при первом обращении
+        self.line_index = LineIndex()
+        # Полнотекстовый индекс строится при первом поиске и дальше
+        # обновляется по событиям шины
+        self.text_index = None
+        # Запросы к индексу и его обновление при развертывании заглушек идут
+        # под блокировкой чтения VFS, поэтому разделяются этой блокировкой
+        self._index_lock = threading.RLock()
+        # Активная транзакция (begin ... commit/rollback)
+        self.transaction = None
+
+    @property
+    def current_path(self):
+        return getattr(self._local, 'current_path', '/')
+
+    @current_path.setter
+    def current_path(self, value):
+        self._local.current_path = value
+
+    @staticmethod
+    def _new_directory(name, parent=None):
+        """Новый узел директории с агрегатами поддерева (для du)
+
+        'order' - имена детей в отсортированном порядке, поддерживается
+        при вставке и удалении, чтобы ls не сортировал заново.
+        """
+        return {
+            'type': 'directory',
+            'name': name,
+            'children': {},
+            'order': [],
+            'parent': parent,
+            'total_size': 0,
+            'file_count': 0,
+            'dir_count': 0
+        }
 
     def load_from_xml(self, xml_path):
         """Загрузка VFS из XML файла"""
+        import xml.etree.ElementTree as ET
+
         try:
             if not os.path.exists(xml_path):
                 return False, f"Файл не найден: {xml_path}"
 
-            tree = ET.parse(xml_path)
-            root_element = tree.getroot()
+            workers = self._load_worker_count(xml_path)
+            if workers > 1:
+                result = self._load_sharded(xml_path, workers)
+                if result is not None:
+                    return result
+
+            if self.lazy_depth is not None:
+                with TRACER.span('load.scan_lazy', path=xml_path):
+                    with open(xml_path, 'rb') as f:
+                        source = f.read()
+                    root_element = ET.fromstring(self._lazy_skeleton(source, 0, len(source), False))
+            else:
+                with TRACER.span('load.parse_xml', path=xml_path):
+                    tree = ET.parse(xml_path)
+                root_element = tree.getroot()
 
             if root_element.tag != 'vfs':
                 return False, "Неверный формат XML: корневой элемент должен быть 'vfs'"
 
-            self.root = {'type': 'directory', 'name': '', 'children': {}}
+            self.root = self._new_directory('')
+            self.current_path = '/'
+            self.lazy_stubs = 0
+            self._lazy_source = source if self.lazy_depth is not None else None
+            self.events.publish('reset', None)
 
-            self._parse_xml_element(root_element, self.root)
+            with TRACER.span('load.build_tree'), gc_paused():
+                self._parse_xml_element(root_element, self.root)
 
             return True, "VFS успешно загружена"
 
@@ -38,30 +892,741 @@ class VFS:
         except Exception as e:
             return False, f"Ошибка загрузки VFS: {e}"
 
+    def _load_worker_count(self, xml_path):
+        """Процессов для загрузки образа; 1 - разбор в текущем процессе"""
+        import multiprocessing
+
+        if self.lazy_depth is not None or 'fork' not in multiprocessing.get_all_start_methods():
+            # Ленивая загрузка и так разбирает только верхние уровни
+            return 1
+        if self.load_workers is not None:
+            return self.load_workers
+        if os.path.getsize(xml_path) < LOAD_PARALLEL_MIN:
+            return 1
+        return os.cpu_count() or 1
+
+    @staticmethod
+    def _shard_bounds(source, parts):
+        """Участки содержимого <vfs> примерно равного объема, разрезанные
+        только между элементами верхнего уровня
+
+        Один проход регулярным выражением по тегам <directory>: точка
+        разреза - конец директории верхнего уровня. Файлы верхнего уровня
+        попадают в участок, где они лежат. Пустой корень <vfs/> - участков
+        нет. None - корень не <vfs> или документ не удалось разметить.
+        """
+        match = XML_ROOT_RE.match(source)
+        if match is None or match.group(1) != b'vfs':
+            return None
+        if match.group(2):
+            return []
+        start = match.end()
+        end = source.rfind(b'</vfs>')
+        if end < start:
+            return None
+        target = max(1, (end - start) // parts)
+        cuts = [start]
+        depth = 0
+        for match in DIRECTORY_TAG_RE.finditer(source, start, end):
+            if match.group(2):
+                continue
+            if match.group(1):
+                depth -= 1
+                if depth == 0 and match.end() - cuts[-1] >= target:
+                    cuts.append(match.end())
+            else:
+                depth += 1
+        if cuts[-1] != end:
+            cuts.append(end)
+        return list(zip(cuts, cuts[1:]))
+
+    def _load_sharded(self, xml_path, workers):
+        """Параллельная загрузка: участки верхнего уровня разбираются пулом процессов
+
+        Образ читается и делится на участки в текущем процессе, дочерние
+        процессы получают его при fork без копирования через канал. Готовые
+        поддеревья присоединяются к новому корню в порядке участков; дерево
+        VFS заменяется только после успешного разбора всех участков. None -
+        образ не делится на участки или участок не разобран: тогда он
+        разбирается целиком, и ошибка формата сообщается с позицией в файле.
+        """
+        global _LOAD_JOB
+        import multiprocessing
+        import xml.etree.ElementTree as ET
+
+        try:
+            with TRACER.span('load.shard_scan', path=xml_path):
+                with open(xml_path, 'rb') as f:
+                    source = f.read()
+                bounds = self._shard_bounds(source, workers * 4)
+            if bounds is None:
+                return None
+
+            root = self._new_directory('')
+            if bounds:
+                with TRACER.span('load.parallel', shards=len(bounds), workers=workers), gc_paused():
+                    with _LOAD_LOCK:
+                        _LOAD_JOB = (source, xml_fragment_prefix(source), self.compression, self.compress_min)
+                        try:
+                            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                                for shard in pool.imap(_load_shard, bounds):
+                                    for name, child in shard['children'].items():
+                                        child['parent'] = root
+                                        root['children'][name] = child
+                        finally:
+                            _LOAD_JOB = None
+                    for child in root['children'].values():
+                        size, files, dirs = self._node_totals(child)
+                        root['total_size'] += size
+                        root['file_count'] += files
+                        root['dir_count'] += dirs
+                    root['order'] = sorted(root['children'])
+
+            self.root = root
+            self.current_path = '/'
+            self.lazy_stubs = 0
+            self._lazy_source = None
+            self.events.publish('reset', None)
+            return True, "VFS успешно загружена"
+
+        except ET.ParseError:
+            # Позиция ошибки в участке не совпадает с позицией в файле
+            return None
+        except Exception as e:
+            return False, f"Ошибка загрузки VFS: {e}"
+
     def _parse_xml_element(self, xml_element, current_node):
+        # Агрегаты считаются снизу вверх по ходу разбора, без отдельного обхода.
+        # Имена интернируются: в больших образах одни и те же имена повторяются
+        # сотни тысяч раз, а парсер создает для каждого атрибута новую строку.
+        # Ключ в children, поле 'name' и элемент 'order' - один и тот же объект
         for child in xml_element:
             if child.tag == 'directory':
-                dir_name = child.get('name', '')
-                new_dir = {'type': 'directory', 'name': dir_name, 'children': {}}
+                dir_name = sys.intern(child.get('name', ''))
+                new_dir = self._new_directory(dir_name, current_node)
                 current_node['children'][dir_name] = new_dir
+                lazy = child.get('lazy')
+                if lazy:
+                    # Заглушка: запоминаем границы содержимого в исходном XML
+                    start, end = lazy.split(':')
+                    new_dir['lazy'] = (self._lazy_source, int(start), int(end))
+                    self.lazy_stubs += 1
                 self._parse_xml_element(child, new_dir)
+                current_node['total_size'] += new_dir['total_size']
+                current_node['file_count'] += new_dir['file_count']
+                current_node['dir_count'] += new_dir['dir_count'] + 1
 
             elif child.tag == 'file':
-                file_name = child.get('name', '')
+                file_name = sys.intern(child.get('name', ''))
                 content = child.text or ''
                 if child.get('encoding') == 'base64':
-                    try:
-                        content = base64.b64decode(content).decode('utf-8')
-                    except:
-                        content = f"[Binary data - decode error]"
+                    content = self._decode_content(content)
 
                 new_file = {
                     'type': 'file',
                     'name': file_name,
-                    'content': content,
-                    'size': len(content)
+                    'parent': current_node
                 }
+                self._store_content(new_file, content)
                 current_node['children'][file_name] = new_file
+                current_node['total_size'] += new_file['size']
+                current_node['file_count'] += 1
+
+        # Одна сортировка на директорию при загрузке
+        current_node['order'] = sorted(current_node['children'])
+
+    def _lazy_skeleton(self, source, start, end, fragment):
+        """XML из source[start:end], где директории глубже lazy_depth заменены заглушками
+
+        Теги ищутся регулярным выражением без разбора содержимого, поэтому
+        стоимость зависит от числа тегов <directory>, а не от объема файлов.
+        Для фрагмента (содержимого директории) добавляется обертка <vfs>.
+        """
+        pieces = []
+        if fragment:
+            pieces.append(xml_fragment_prefix(source))
+
+        position = start
+        depth = 0
+        stub_tag = None
+        inner_start = None
+        for match in DIRECTORY_TAG_RE.finditer(source, start, end):
+            if match.group(2):
+                continue
+            if match.group(1):
+                depth -= 1
+                if stub_tag is not None and depth == self.lazy_depth:
+                    pieces.append(stub_tag[:-1] + b' lazy="%d:%d"/>' % (inner_start, match.start()))
+                    position = match.end()
+                    stub_tag = None
+            else:
+                depth += 1
+                if stub_tag is None and depth == self.lazy_depth + 1:
+                    pieces.append(source[position:match.start()])
+                    stub_tag = match.group(0)
+                    inner_start = match.end()
+
+        pieces.append(source[position:end])
+        if fragment:
+            pieces.append(b'</vfs>')
+        return b''.join(pieces)
+
+    def _parse_stub(self, lazy, target):
+        """Разобрать содержимое заглушки в директорию target"""
+        import xml.etree.ElementTree as ET
+
+        source, start, end = lazy
+        saved_source = self._lazy_source
+        self._lazy_source = source
+        try:
+            self._parse_xml_element(ET.fromstring(self._lazy_skeleton(source, start, end, True)), target)
+        finally:
+            self._lazy_source = saved_source
+
+    def _materialize(self, node):
+        """Развернуть заглушку директории (следующие уровни снова будут заглушками)
+
+        Вызывается под блокировкой чтения из параллельных читателей. Метка
+        'lazy' снимается только после разбора: читатель, увидевший ее, ждет
+        _materialize_lock, а не видевший - получает заполненную директорию.
+        """
+        with self._materialize_lock:
+            lazy = node.get('lazy')
+            if lazy is None:
+                return
+            with TRACER.span('lazy.materialize', directory=node['name']):
+                self._parse_stub(lazy, node)
+            del node['lazy']
+            self.lazy_stubs -= 1
+            # Агрегаты заглушки были нулевыми: добавляем развернутое содержимое предкам.
+            # Развертывание не откатывается и применяется сразу; в транзакции оно
+            # журналируется, чтобы откат перенес агрегаты на восстановленных предков
+            totals = (node['total_size'], node['file_count'], node['dir_count'])
+            self._apply_totals(node['parent'], *totals)
+            if self.transaction is not None:
+                self.transaction.journal.append(('expand', node) + totals)
+            self.events.publish('expand', node)
+
+    def _materialize_tree(self, node):
+        """Развернуть все заглушки поддерева (нужно для точных агрегатов du)"""
+        if not self.lazy_stubs or node['type'] != 'directory':
+            return
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if 'lazy' in current:
+                self._materialize(current)
+            stack.extend(child for child in current['children'].values() if child['type'] == 'directory')
+
+    def _store_content(self, node, content):
+        """Записать содержимое файла; крупное сжимается при включенном сжатии
+
+        Для файла, уже находящегося в дереве, обновляются агрегаты предков
+        и публикуется событие modify.
+        """
+        attached = 'content' in node and node.get('parent') is not None
+        node.pop('hash', None)
+        if attached:
+            old_content = node['content']
+            self._update_totals(node['parent'], len(content) - node['size'], 0, 0)
+        node['size'] = len(content)
+        if self.compression and len(content) >= self.compress_min:
+            node['content'] = content_codec(self.compression).compress(content.encode('utf-8'))
+            node['codec'] = self.compression
+        else:
+            node['content'] = content
+            node.pop('codec', None)
+        if attached:
+            self.events.publish('modify', node, old_content)
+
+    def read_content(self, node):
+        """Содержимое файла в виде строки (сжатое распаковывается через LRU)"""
+        codec = node.get('codec')
+        if codec is None:
+            return node['content']
+        return self.content_cache.get(node['content'], codec)
+
+    def line_offsets(self, node):
+        """Позиции '\n' в содержимом файла; при первом обращении - один проход"""
+        content = node['content']
+        newlines = self.line_index.get(content)
+        if newlines is None:
+            with TRACER.span('lines.index', file=node['name']):
+                if node.get('codec') == 'host':
+                    newlines = content.newlines()
+                else:
+                    newlines = array('Q')
+                    newlines.fromlist([match.start() for match in NEWLINE_RE.finditer(self.read_content(node))])
+            if self.line_index.put(content, newlines):
+                self.events.subscribe(self._line_changes)
+        return newlines
+
+    def line_count(self, node):
+        """Число строк: завершающий '\n' заканчивает последнюю строку, а не начинает новую"""
+        newlines = self.line_offsets(node)
+        size = node['size']
+        return len(newlines) + (1 if size and (not newlines or newlines[-1] != size - 1) else 0)
+
+    def read_lines(self, node, first, last):
+        """Строки [first, last) файла (с нуля); читается только их участок"""
+        newlines = self.line_offsets(node)
+        last = min(last, self.line_count(node))
+        if first >= last:
+            return []
+        start = newlines[first - 1] + 1 if first else 0
+        end = newlines[last - 1] if last <= len(newlines) else None
+        if node.get('codec') == 'host':
+            content = node['content']
+            data = content.read_range(start, len(content) if end is None else end)
+            return data.decode('utf-8', 'replace').split('\n')
+        return self.read_content(node)[start:end].split('\n')
+
+    def _line_changes(self, events):
+        """Подписчик шины: позиции строк замененного содержимого больше не нужны"""
+        for kind, node, detail in events:
+            if kind == 'modify':
+                self.line_index.discard(detail)
+            elif kind == 'reset':
+                self.line_index.clear()
+                self.events.unsubscribe(self._line_changes)
+                return
+
+    @staticmethod
+    def _copy_file_node(node, name, parent=None):
+        """Копия узла файла; содержимое (в том числе сжатое) разделяется"""
+        new_file = {
+            'type': 'file',
+            'name': name,
+            'content': node['content'],
+            'size': node['size'],
+            'parent': parent
+        }
+        if 'codec' in node:
+            new_file['codec'] = node['codec']
+        if 'hash' in node:
+            new_file['hash'] = node['hash']
+        return new_file
+
+    @staticmethod
+    def _decode_content(data):
+        """Декодирование base64-содержимого файла"""
+        import base64
+
+        try:
+            return base64.b64decode(data).decode('utf-8')
+        except:
+            return f"[Binary data - decode error]"
+
+    def import_tree(self, args):
+        """import [-j ПОТОКИ] [--lazy-above БАЙТ] ИСТОЧНИК [НАЗНАЧЕНИЕ]
+
+        Поддерево из директории или tar-архива хоста. Структура строится
+        одним проходом, содержимое читается пулом потоков; файлы крупнее
+        --lazy-above не читаются, а запоминаются ссылкой на хост. Поддерево
+        собирается отдельно и присоединяется к дереву одной операцией.
+        """
+        import tarfile
+
+        workers = None
+        lazy_above = None
+        paths = []
+        i = 0
+        while i < len(args):
+            if args[i] in ("-j", "--lazy-above") and i + 1 < len(args):
+                try:
+                    value = int(args[i + 1])
+                except ValueError:
+                    return f"Ошибка: '{args[i + 1]}' не является числом"
+                if args[i] == "-j":
+                    workers = max(1, value)
+                else:
+                    lazy_above = value
+                i += 2
+            else:
+                paths.append(args[i])
+                i += 1
+
+        if not paths or len(paths) > 2:
+            return "Ошибка: использование: import [-j ПОТОКИ] [--lazy-above БАЙТ] ИСТОЧНИК [НАЗНАЧЕНИЕ]"
+        source = os.path.expanduser(paths[0])
+
+        if os.path.isdir(source):
+            name = os.path.basename(os.path.normpath(source))
+        elif os.path.isfile(source) and tarfile.is_tarfile(source):
+            name = os.path.basename(source)
+            for suffix in ('.tar.gz', '.tar.bz2', '.tar.xz', '.tgz', '.tar'):
+                if name.endswith(suffix):
+                    name = name[:-len(suffix)]
+                    break
+        else:
+            return f"Ошибка: '{paths[0]}' не является директорией или tar-архивом"
+
+        # Как в cp: в существующую директорию - под исходным именем
+        dest = paths[1] if len(paths) > 1 else '.'
+        dest_node = self.get_node_by_path(dest)
+        if dest_node and dest_node['type'] == 'directory':
+            parent = dest_node
+        elif dest_node:
+            return f"Ошибка: '{dest}' уже существует"
+        else:
+            parent, name = self.get_parent_and_name(dest)
+            if not parent or parent['type'] != 'directory' or not name:
+                return f"Ошибка: путь '{dest}' недействителен"
+        if name in parent['children']:
+            return f"Ошибка: '{self.node_path(parent).rstrip('/')}/{name}' уже существует"
+
+        start = time.perf_counter()
+        subtree = self._new_directory(name)
+        pending = []
+        try:
+            with TRACER.span('import.scan', source=source):
+                if os.path.isdir(source):
+                    skipped = self._scan_host_directory(source, subtree, pending, lazy_above)
+                else:
+                    skipped = self._scan_tar(source, subtree, pending, lazy_above)
+            with TRACER.span('import.read', files=len(pending)):
+                self._read_host_files(pending, workers)
+        except (OSError, tarfile.TarError) as e:
+            return f"Ошибка импорта: {e}"
+
+        self._rebuild_totals(subtree, None)
+        self._attach(parent, name, subtree)
+
+        elapsed = time.perf_counter() - start
+        lazy = sum(1 for node in iter_files(subtree) if node.get('codec') == 'host')
+        lines = [f"Импортировано в '{self.node_path(subtree)}': {subtree['dir_count']} директорий, "
+                 f"{subtree['file_count']} файлов за {format_duration(elapsed)}"]
+        if lazy:
+            lines.append(f"Не загружено (крупнее {lazy_above} байт): {lazy} файлов")
+        if skipped:
+            lines.append(f"Пропущено (недоступно или не файл): {skipped}")
+        return "\n".join(lines)
+
+    def _host_file_node(self, name, parent, source, size, pending, lazy_above):
+        name = sys.intern(name)
+        node = {'type': 'file', 'name': name, 'parent': parent}
+        if lazy_above is not None and size > lazy_above:
+            source.size = size
+            node['content'] = source
+            node['codec'] = 'host'
+            node['size'] = size
+        else:
+            pending.append((node, source))
+        parent['children'][name] = node
+
+    def _scan_host_directory(self, path, subtree, pending, lazy_above):
+        """Структура директории хоста; символические ссылки на директории не обходятся"""
+        skipped = 0
+        stack = [(path, subtree)]
+        while stack:
+            host_path, node = stack.pop()
+            try:
+                entries = list(os.scandir(host_path))
+            except OSError:
+                skipped += 1
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    name = sys.intern(entry.name)
+                    child = self._new_directory(name, node)
+                    node['children'][name] = child
+                    stack.append((entry.path, child))
+                elif entry.is_file():
+                    # stat нужен только для порога ленивой загрузки
+                    size = entry.stat().st_size if lazy_above is not None else 0
+                    self._host_file_node(entry.name, node, HostFile(entry.path), size, pending, lazy_above)
+                else:
+                    skipped += 1
+        return skipped
+
+    def _scan_tar(self, path, subtree, pending, lazy_above):
+        """Структура tar-архива; содержимое несжатого архива читается по смещениям
+
+        Сжатый архив читается последовательно сразу, без ленивой загрузки:
+        произвольный доступ к его участкам потребовал бы распаковки с начала.
+        """
+        import tarfile
+
+        try:
+            tar = tarfile.open(path, 'r:')
+            plain = True
+        except tarfile.ReadError:
+            tar = tarfile.open(path, 'r:*')
+            plain = False
+
+        skipped = 0
+        with tar:
+            for member in tar:
+                parts = [part for part in member.name.split('/') if part and part != '.']
+                if not parts or '..' in parts:
+                    skipped += 1
+                    continue
+                node = subtree
+                for part in parts[:-1] if not member.isdir() else parts:
+                    child = node['children'].get(part)
+                    if child is None or child['type'] != 'directory':
+                        part = sys.intern(part)
+                        child = node['children'][part] = self._new_directory(part, node)
+                    node = child
+                if member.isdir():
+                    continue
+                if not member.isfile():
+                    skipped += 1
+                    continue
+                if plain:
+                    source = HostFile(path, member.offset_data, member.size)
+                    self._host_file_node(parts[-1], node, source, member.size, pending, lazy_above)
+                else:
+                    data = tar.extractfile(member).read()
+                    name = sys.intern(parts[-1])
+                    file_node = {'type': 'file', 'name': name, 'parent': node}
+                    self._store_content(file_node, data.decode('utf-8', 'replace'))
+                    node['children'][name] = file_node
+        return skipped
+
+    def _read_host_files(self, pending, workers):
+        """Прочитать содержимое пулом потоков (чтение файлов отпускает GIL)
+
+        Задача пула - пачка файлов: на мелких файлах накладные расходы
+        задачи сравнимы со временем чтения.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if not pending:
+            return
+        batches = [pending[i:i + IMPORT_BATCH] for i in range(0, len(pending), IMPORT_BATCH)]
+        with ThreadPoolExecutor(workers) as pool:
+            for batch, contents in zip(batches, pool.map(lambda batch: [source.read() for _, source in batch], batches)):
+                for (node, _), data in zip(batch, contents):
+                    self._store_content(node, data.decode('utf-8', 'replace'))
+
+    def vfs_export(self, args):
+        """vfs-export ФАЙЛ.xml|ФАЙЛ.tar[.gz] [ПУТЬ]: запись дерева по ходу обхода
+
+        В памяти одновременно только содержимое текущего файла; заглушки
+        ленивой загрузки разбираются временно и к дереву не присоединяются.
+        Запись идет во временный файл, который заменяет целевой по завершении.
+        """
+        if not args or len(args) > 2:
+            return "Ошибка: использование: vfs-export ФАЙЛ.xml|ФАЙЛ.tar [ПУТЬ]"
+        target = os.path.expanduser(args[0])
+        path = args[1] if len(args) > 1 else '/'
+        node = self.get_node_by_path(path)
+        if not node:
+            return f"Ошибка: путь '{path}' не найден"
+        if node['type'] != 'directory':
+            return f"Ошибка: '{path}' не является директорией"
+
+        if target.endswith('.xml'):
+            writer = self._export_xml
+        elif target.endswith(('.tar', '.tar.gz', '.tgz')):
+            writer = self._export_tar
+        else:
+            return "Ошибка: поддерживается экспорт в .xml, .tar и .tar.gz"
+
+        start = time.perf_counter()
+        temporary = f"{target}.{os.getpid()}.tmp"
+        try:
+            with TRACER.span('export', target=target):
+                counts = writer(temporary, node)
+            os.replace(temporary, target)
+        except OSError as e:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return f"Ошибка экспорта: {e}"
+
+        return (f"Экспортировано в '{target}': {counts[0]} директорий, {counts[1]} файлов "
+                f"за {format_duration(time.perf_counter() - start)}")
+
+    def _export_walk(self, node, path=''):
+        """(относительный путь, узел) в порядке обхода, 'end' - после содержимого директории"""
+        children = node
+        if 'lazy' in node:
+            children = self._new_directory(node['name'])
+            with self._materialize_lock:
+                # Временные заглушки не входят в счетчик заглушек дерева
+                stubs = self.lazy_stubs
+                self._parse_stub(node['lazy'], children)
+                self.lazy_stubs = stubs
+        for name in children['order']:
+            child = children['children'][name]
+            child_path = f"{path}/{name}" if path else name
+            yield child_path, child, 'start'
+            if child['type'] == 'directory':
+                yield from self._export_walk(child, child_path)
+                yield child_path, child, 'end'
+
+    def _export_xml(self, target, node):
+        from xml.sax.saxutils import escape, quoteattr
+        import base64
+
+        dirs = files = 0
+        depth = 1
+        with open(target, 'w', encoding='utf-8', buffering=1 << 20) as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n<vfs>\n')
+            for _, child, event in self._export_walk(node):
+                if event == 'end':
+                    depth -= 1
+                    out.write(f"{'  ' * depth}</directory>\n")
+                elif child['type'] == 'directory':
+                    dirs += 1
+                    # Хеш пишется, если его можно получить без развертывания заглушек;
+                    # хеши файлов при этом в узлах не остаются. Загрузчик его не
+                    # читает: образ могли править, хеши считаются по содержимому
+                    digest = child.get('hash')
+                    if digest is None and not self.lazy_stubs:
+                        digest = self.tree_hash(child, cache_files=False)
+                    attributes = f' hash="{digest.hex()}"' if digest else ''
+                    out.write(f"{'  ' * depth}<directory name={quoteattr(child['name'])}{attributes}>\n")
+                    depth += 1
+                else:
+                    files += 1
+                    content = self.read_content(child)
+                    name = quoteattr(child['name'])
+                    if XML_UNSAFE_RE.search(content):
+                        data = base64.b64encode(content.encode('utf-8')).decode('ascii')
+                        out.write(f'{"  " * depth}<file name={name} encoding="base64">{data}</file>\n')
+                    else:
+                        out.write(f"{'  ' * depth}<file name={name}>{escape(content)}</file>\n")
+            out.write('</vfs>\n')
+        return dirs, files
+
+    def _export_tar(self, target, node):
+        import io
+        import tarfile
+
+        dirs = files = 0
+        mtime = int(time.time())
+        mode = 'w:gz' if target.endswith(('.gz', '.tgz')) else 'w'
+        # Имя временного файла не говорит о сжатии, поэтому режим задается явно;
+        # заголовки GNU формируются вдвое быстрее PAX, длинные имена поддерживают
+        with tarfile.open(target, mode, format=tarfile.GNU_FORMAT) as tar:
+            for path, child, event in self._export_walk(node):
+                if event == 'end':
+                    continue
+                info = tarfile.TarInfo(path)
+                info.mtime = mtime
+                if child['type'] == 'directory':
+                    dirs += 1
+                    info.type = tarfile.DIRTYPE
+                    info.mode = 0o755
+                    tar.addfile(info)
+                else:
+                    files += 1
+                    data = self.read_content(child).encode('utf-8')
+                    info.size = len(data)
+                    info.mode = 0o644
+                    tar.addfile(info, io.BytesIO(data))
+                # TarFile хранит заголовки всех записанных членов; для записи
+                # они не нужны, а на больших деревьях занимают сотни мегабайт
+                tar.members.clear()
+        return dirs, files
+
+    def tree_hash(self, node, cache_files=True):
+        """Хеш Меркла узла (blake2b, 16 байт), кэшируется в узле
+
+        Файл - хеш содержимого; директория - хеш имен, типов и хешей детей
+        в порядке имен. Кэш сбрасывается у предков при любом изменении
+        (_update_totals), так что после правки пересчитывается только путь
+        от нее до корня. Заглушка разворачивается: хешу из образа не доверяется.
+        cache_files=False оставляет кэш только в директориях (экспорт).
+        """
+        digest = node.get('hash')
+        if digest is not None:
+            return digest
+        import hashlib
+
+        if node['type'] == 'file':
+            digest = hashlib.blake2b(self.read_content(node).encode('utf-8'), digest_size=16).digest()
+            if not cache_files:
+                return digest
+        else:
+            if 'lazy' in node:
+                self._materialize(node)
+            hasher = hashlib.blake2b(digest_size=16)
+            for name in node['order']:
+                child = node['children'][name]
+                encoded = name.encode('utf-8')
+                hasher.update(b'%s%d:' % (b'f' if child['type'] == 'file' else b'd', len(encoded)))
+                hasher.update(encoded)
+                hasher.update(self.tree_hash(child, cache_files))
+            digest = hasher.digest()
+        node['hash'] = digest
+        return digest
+
+    def _diff_operand(self, operand):
+        """(VFS, узел) для vfs-diff: образ .xml/.tar хоста или путь в текущей VFS"""
+        host = os.path.expanduser(operand)
+        if operand.endswith(('.xml', '.tar', '.tar.gz', '.tgz')) and os.path.isfile(host):
+            # Образ загружается целиком: хеши считаются по содержимому, а не берутся
+            # из атрибутов XML, поэтому ленивая загрузка все равно развернула бы все
+            image = VFS(compression=self.compression, compress_min=self.compress_min)
+            if operand.endswith('.xml'):
+                success, message = image.load_from_xml(host)
+                if not success:
+                    return message
+                return image, image.root
+            image.vfs_init()
+            message = image.import_tree([host, '/image'])
+            if message.startswith("Ошибка"):
+                return message
+            return image, image.get_node_by_path('/image')
+
+        node = self.get_node_by_path(operand)
+        if not node:
+            return f"путь '{operand}' не найден"
+        return self, node
+
+    def vfs_diff(self, args):
+        """vfs-diff A B: различия двух образов или поддеревьев текущей VFS
+
+        Поддеревья с совпадающими хешами Меркла пропускаются целиком.
+        """
+        if len(args) != 2:
+            return "Ошибка: использование: vfs-diff A B (образ .xml/.tar или путь в VFS)"
+        operands = []
+        for operand in args:
+            result = self._diff_operand(operand)
+            if isinstance(result, str):
+                return f"Ошибка: {result}"
+            operands.append(result)
+        (left_vfs, left), (right_vfs, right) = operands
+
+        lines = []
+        stats = {'compared': 0, 'skipped': 0}
+        with TRACER.span('vfs-diff'):
+            self._diff_nodes(left_vfs, left, right_vfs, right, '', lines, stats)
+
+        summary = (f"сравнено директорий: {stats['compared']}, "
+                   f"совпавших поддеревьев пропущено: {stats['skipped']}")
+        if not lines:
+            return f"Различий нет ({summary})"
+        lines.append(f"Различий: {len(lines)} ({summary})")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _diff_nodes(left_vfs, left, right_vfs, right, path, lines, stats):
+        if left_vfs.tree_hash(left) == right_vfs.tree_hash(right):
+            stats['skipped'] += 1
+            return
+        if left['type'] == 'file' or right['type'] == 'file':
+            lines.append(f"M {path or '/'}")
+            return
+
+        stats['compared'] += 1
+        for node, vfs in ((left, left_vfs), (right, right_vfs)):
+            if 'lazy' in node:
+                vfs._materialize(node)
+        left_children, right_children = left['children'], right['children']
+        for name in sorted(set(left['order']).union(right['order'])):
+            child_path = f"{path}/{name}"
+            if name not in right_children:
+                lines.append(f"- {child_path}")
+            elif name not in left_children:
+                lines.append(f"+ {child_path}")
+            else:
+                VFS._diff_nodes(left_vfs, left_children[name], right_vfs, right_children[name],
+                                child_path, lines, stats)
 
     def vfs_init(self):
         self.root = {
@@ -83,14 +1648,12 @@ class VFS:
                                         'readme.txt': {
                                             'type': 'file',
                                             'name': 'readme.txt',
-                                            'content': 'Добро пожаловать в VFS!\nЭто тестовый файл.\nТретья строка.',
-                                            'size': 67
+                                            'content': 'Добро пожаловать в VFS!\nЭто тестовый файл.\nТретья строка.'
                                         },
                                         'notes.txt': {
                                             'type': 'file',
                                             'name': 'notes.txt',
-                                            'content': 'Заметки пользователя\nВторая строка заметок',
-                                            'size': 49
+                                            'content': 'Заметки пользователя\nВторая строка заметок'
                                         }
                                     }
                                 },
@@ -101,8 +1664,7 @@ class VFS:
                                         'archive.zip': {
                                             'type': 'file',
                                             'name': 'archive.zip',
-                                            'content': 'binary data here',
-                                            'size': 15
+                                            'content': 'binary data here'
                                         }
                                     }
                                 }
@@ -117,14 +1679,12 @@ class VFS:
                         'config.txt': {
                             'type': 'file',
                             'name': 'config.txt',
-                            'content': 'version=1.0\nlanguage=ru\nmode=production',
-                            'size': 41
+                            'content': 'version=1.0\nlanguage=ru\nmode=production'
                         },
                         'system.conf': {
                             'type': 'file',
                             'name': 'system.conf',
-                            'content': '# System configuration\nhostname=localhost',
-                            'size': 40
+                            'content': '# System configuration\nhostname=localhost'
                         }
                     }
                 },
@@ -139,8 +1699,7 @@ class VFS:
                                 'app.log': {
                                     'type': 'file',
                                     'name': 'app.log',
-                                    'content': 'INFO: Application started\nERROR: Connection failed\nWARN: Retrying...',
-                                    'size': 72
+                                    'content': 'INFO: Application started\nERROR: Connection failed\nWARN: Retrying...'
                                 }
                             }
                         }
@@ -153,8 +1712,7 @@ class VFS:
                         'script.sh': {
                             'type': 'file',
                             'name': 'script.sh',
-                            'content': '#!/bin/bash\necho "Hello World"',
-                            'size': 28
+                            'content': '#!/bin/bash\necho "Hello World"'
                         }
                     }
                 },
@@ -165,87 +1723,328 @@ class VFS:
                 }
             }
         }
-        self.current_path = Path('/')
+        # Размер - длина содержимого, как при загрузке XML и в wc
+        for node in iter_files(self.root):
+            node['size'] = len(node['content'])
+        self._rebuild_totals(self.root, None)
+        self.current_path = '/'
+        self.lazy_stubs = 0
+        self.events.publish('reset', None)
         return "VFS инициализирована по умолчанию"
 
+    def _rebuild_totals(self, node, parent):
+        """Проставить ссылки на родителя и пересчитать агрегаты поддерева"""
+        node['parent'] = parent
+        if node['type'] == 'file':
+            return
+        node['total_size'] = node['file_count'] = node['dir_count'] = 0
+        node['order'] = sorted(node['children'])
+        for child in node['children'].values():
+            self._rebuild_totals(child, node)
+            size, files, dirs = self._node_totals(child)
+            node['total_size'] += size
+            node['file_count'] += files
+            node['dir_count'] += dirs
+
+    @staticmethod
+    def _node_totals(node):
+        """Вклад узла в агрегаты родителя: (байты, файлы, директории)"""
+        if node['type'] == 'file':
+            return node['size'], 1, 0
+        return node['total_size'], node['file_count'], node['dir_count'] + 1
+
+    def _update_totals(self, node, size, files, dirs):
+        """Применить изменение агрегатов ко всей цепочке предков
+
+        Любое изменение поддерева проходит здесь, поэтому здесь же
+        сбрасываются хеши Меркла предков. В транзакции изменение только
+        запоминается для директории и применяется при commit.
+        """
+        transaction = self.transaction
+        if transaction is not None and node is not None:
+            delta = transaction.deltas.get(id(node))
+            if delta is None:
+                transaction.deltas[id(node)] = [node, size, files, dirs]
+            else:
+                delta[1] += size
+                delta[2] += files
+                delta[3] += dirs
+            return
+        self._apply_totals(node, size, files, dirs)
+
+    def _apply_totals(self, node, size, files, dirs):
+        while node is not None:
+            node.pop('hash', None)
+            node['total_size'] += size
+            node['file_count'] += files
+            node['dir_count'] += dirs
+            node = node['parent']
+
+    def _attach(self, parent, name, node, moved=False):
+        """Добавить узел в директорию с обновлением агрегатов и событием create
+
+        moved - узел возвращается в дерево после _detach (mv); в пакете
+        шины пара delete/create сливается в move. Имя интернируется и
+        разделяется ключом children, полем 'name' и списком 'order'.
+        """
+        name = sys.intern(name)
+        node['name'] = name
+        node['parent'] = parent
+        if name not in parent['children']:
+            bisect.insort(parent['order'], name)
+        parent['children'][name] = node
+        self._update_totals(parent, *self._node_totals(node))
+        if self.transaction is not None:
+            self.transaction.journal.append(('attach', parent, name, node, moved))
+        self.events.publish('create', node)
+
+    def _detach(self, parent, name, moved=False):
+        """Удалить узел из директории с обновлением агрегатов и событием delete"""
+        node = parent['children'].pop(name)
+        order = parent['order']
+        del order[bisect.bisect_left(order, name)]
+        size, files, dirs = self._node_totals(node)
+        self._update_totals(parent, -size, -files, -dirs)
+        if self.transaction is not None:
+            self.transaction.journal.append(('detach', parent, name, node, moved))
+        self.events.publish('delete', node, (parent, name))
+        return node
+
+    def begin(self, owner=None):
+        """Начать транзакцию: агрегаты и события шины применяются при commit"""
+        if self.transaction is not None:
+            return "Ошибка: транзакция уже начата"
+        self.transaction = Transaction(owner)
+        self.events.begin()
+        return "Транзакция начата"
+
+    def commit(self):
+        transaction = self.transaction
+        if transaction is None:
+            return "Ошибка: нет активной транзакции"
+        self.transaction = None
+        if transaction.failed:
+            self.events.end()
+            return f"Транзакция отменена: {transaction.failed}"
+        with TRACER.span('transaction.commit', operations=transaction.operations):
+            self._flush_transaction(transaction, journal=False)
+        self.events.end()
+        return f"Транзакция применена: {transaction.operations} операций"
+
+    def rollback(self):
+        transaction = self.transaction
+        if transaction is None:
+            return "Ошибка: нет активной транзакции"
+        self.transaction = None
+        if not transaction.failed:
+            self._undo_transaction(transaction)
+        self.events.end()
+        return f"Транзакция отменена: {transaction.operations} операций"
+
+    def abort_transaction(self, reason):
+        """Отменить изменения после ошибки; транзакция остается до commit/rollback"""
+        transaction = self.transaction
+        with TRACER.span('transaction.abort', operations=transaction.operations):
+            self._undo_transaction(transaction)
+        transaction.failed = reason
+
+    def flush_transaction(self):
+        """Применить отложенное (для команд чтения внутри транзакции) с записью в журнал"""
+        if self.transaction is not None:
+            self._flush_transaction(self.transaction, journal=True)
+
+    def _flush_transaction(self, transaction, journal):
+        """Применить накопленные агрегаты одним проходом и доставить события
+
+        Изменения директорий поднимаются к корню по уровням глубины,
+        сливаясь у общих предков, поэтому каждый предок обновляется
+        один раз, а не при каждой операции.
+        """
+        levels = {}
+        for delta in transaction.deltas.values():
+            depth = 0
+            node = delta[0]['parent']
+            while node is not None:
+                depth += 1
+                node = node['parent']
+            levels.setdefault(depth, {})[id(delta[0])] = delta
+        transaction.deltas = {}
+
+        # Уровни предков добавляются по ходу прохода, поэтому глубина
+        # перебирается до корня, а не по ключам, собранным заранее
+        for depth in range(max(levels, default=-1), -1, -1):
+            for node, size, files, dirs in levels.pop(depth, {}).values():
+                node.pop('hash', None)
+                node['total_size'] += size
+                node['file_count'] += files
+                node['dir_count'] += dirs
+                if journal:
+                    transaction.journal.append(('totals', node, size, files, dirs))
+                parent = node['parent']
+                if parent is None:
+                    continue
+                # Уровень предка определяется по текущему положению узла
+                parent_level = levels.setdefault(depth - 1, {})
+                pending = parent_level.get(id(parent))
+                if pending is None:
+                    parent_level[id(parent)] = [parent, size, files, dirs]
+                else:
+                    pending[1] += size
+                    pending[2] += files
+                    pending[3] += dirs
+
+        # События журналируются и без подписчиков: индекс, построенный
+        # после этой точки, тоже должен откатиться при rollback
+        events = self.events.flush()
+        if journal and events:
+            transaction.journal.append(('events', events))
+
+    @staticmethod
+    def _has_ancestor_in(node, keys):
+        node = node['parent']
+        while node is not None:
+            if id(node) in keys:
+                return True
+            node = node['parent']
+        return False
+
+    def _undo_transaction(self, transaction):
+        """Откат по журналу в обратном порядке; неприменённое просто отбрасывается
+
+        Уже доставленным событиям подписчики получают обратные после отката.
+        """
+        transaction.deltas = {}
+        self.events.discard()
+        undone = []
+        expanded = []
+        for entry in reversed(transaction.journal):
+            kind = entry[0]
+            if kind == 'attach':
+                _, parent, name, node, moved = entry
+                del parent['children'][name]
+                order = parent['order']
+                del order[bisect.bisect_left(order, name)]
+                if not moved:
+                    # Копии заглушек учитывались в счетчике при cp
+                    self.lazy_stubs -= sum(1 for child in iter_directories(node) if 'lazy' in child)
+            elif kind == 'detach':
+                _, parent, name, node, moved = entry
+                node['parent'] = parent
+                node['name'] = name
+                bisect.insort(parent['order'], name)
+                parent['children'][name] = node
+            elif kind == 'totals':
+                _, node, size, files, dirs = entry
+                node.pop('hash', None)
+                node['total_size'] -= size
+                node['file_count'] -= files
+                node['dir_count'] -= dirs
+            elif kind == 'expand':
+                # Развернутое остается развернутым: вклад снимается с предков
+                # на момент развертывания и возвращается после отката
+                _, node, size, files, dirs = entry
+                self._apply_totals(node['parent'], -size, -files, -dirs)
+                expanded.append(entry)
+            elif kind == 'events':
+                # Место узла сейчас - то, что видели подписчики при доставке
+                for event_kind, node, detail in reversed(entry[1]):
+                    if event_kind == 'create':
+                        undone.append(('delete', node, (node['parent'], node['name'])))
+                    elif event_kind == 'delete':
+                        undone.append(('create', node, None))
+                    elif event_kind == 'move':
+                        undone.append(('move', node, (node['parent'], node['name'])))
+        transaction.journal = []
+        for _, node, size, files, dirs in expanded:
+            # Заглушки из поддеревьев, добавленных в транзакции, ушли вместе с ними
+            if self._in_tree(node):
+                self._apply_totals(node['parent'], size, files, dirs)
+        if undone:
+            self.events.notify(undone)
+
+    def _in_tree(self, node):
+        """Узел достижим из корня по ссылкам на родителя"""
+        while node['parent'] is not None:
+            if node['parent']['children'].get(node['name']) is not node:
+                return False
+            node = node['parent']
+        return node is self.root
+
+    def node_path(self, node):
+        """Абсолютный путь узла по ссылкам на родителя"""
+        names = []
+        while node['parent'] is not None:
+            names.append(node['name'])
+            node = node['parent']
+        return '/' + '/'.join(reversed(names))
+
+    def _abs_parts(self, path):
+        """Компоненты абсолютного пути с учетом текущей директории, '.' и '..'"""
+        full = path if path.startswith('/') else f"{self.current_path}/{path}"
+        parts = []
+        for part in full.split('/'):
+            if not part or part == '.':
+                continue
+            if part == '..':
+                if parts:
+                    parts.pop()
+            else:
+                parts.append(part)
+        return parts
+
+    def _walk(self, parts):
+        """Спуск от корня по компонентам пути; промежуточные узлы - директории"""
+        current = self.root
+        for part in parts:
+            if current['type'] != 'directory':
+                return None
+            if 'lazy' in current:
+                self._materialize(current)
+            if part not in current['children']:
+                return None
+            current = current['children'][part]
+        if 'lazy' in current:
+            self._materialize(current)
+        return current
+
     def get_node_by_path(self, path):
         """Получить узел по абсолютному или относительному пути"""
         if not path or path == '.':
             return self.get_current_directory()
 
-        if path == '/':
-            return self.root
-
-        path_obj = Path(path)
-
-        # Обработка абсолютного пути
-        if path.startswith('/'):
-            current = self.root
-            for part in path_obj.parts[1:]:
-                if part in current['children'] and current['children'][part]['type'] == 'directory':
-                    current = current['children'][part]
-                else:
-                    return None
-            return current
-
-        # Обработка относительного пути
-        current = self.get_current_directory()
-        if not current:
-            return None
-
-        for part in path_obj.parts:
-            if part == '..':
-                # Для .. нужно подняться на уровень выше
-                if self.current_path != Path('/'):
-                    # Временно меняем путь и получаем новую текущую директорию
-                    old_path = self.current_path
-                    self.current_path = self.current_path.parent
-                    current = self.get_current_directory()
-                    self.current_path = old_path
-            elif part != '.':
-                if part in current['children'] and current['children'][part]['type'] == 'directory':
-                    current = current['children'][part]
-                else:
-                    return None
-        return current
+        with TRACER.span('resolve', path=path):
+            return self._walk(self._abs_parts(path))
 
     def get_parent_and_name(self, path):
         """Получить родительский узел и имя файла/директории из пути"""
-        path_obj = Path(path)
-
-        if path == '/':
+        parts = self._abs_parts(path)
+        if not parts:
             return self.root, ''
 
-        if path.startswith('/'):
-            current = self.root
-            parts = path_obj.parts[1:]
-        else:
-            current = self.get_current_directory()
-            parts = path_obj.parts
+        with TRACER.span('resolve_parent', path=path):
+            parent = self._walk(parts[:-1])
+        if not parent or parent['type'] != 'directory':
+            return None, None
 
-        if not parts:
-            return current, ''
+        return parent, parts[-1]
 
-        # Проходим до предпоследней части пути
-        for part in parts[:-1]:
-            if part in current['children'] and current['children'][part]['type'] == 'directory':
-                current = current['children'][part]
-            else:
-                return None, None
+    def get_current_directory(self):
+        current = self._walk([part for part in self.current_path.split('/') if part])
+        if current and current['type'] == 'directory':
+            return current
+        return None
 
-        return current, parts[-1]
+    LS_CHUNK = 1000
 
-    def get_current_directory(self):
-        current = self.root
-        if self.current_path != Path('/'):
-            for part in self.current_path.parts[1:]:
-                if part in current['children'] and current['children'][part]['type'] == 'directory':
-                    current = current['children'][part]
-                else:
-                    return None
-        return current
+    def ls(self, path=None, offset=0, limit=None):
+        """Список директории (целиком; для больших директорий см. ls_chunks)"""
+        target = self.ls_target(path)
+        if isinstance(target, str):
+            return target
+        return "\n".join(self.ls_chunks(target, offset, limit))
 
-    def ls(self, path=None):
+    def ls_target(self, path):
+        """Директория для ls или строка с ошибкой"""
         if path:
             target = self.get_node_by_path(path)
         else:
@@ -257,36 +2056,95 @@ class VFS:
         if target['type'] != 'directory':
             return f"Ошибка: '{path}' не является директорией"
 
-        result = []
-        for name, item in target['children'].items():
-            if item['type'] == 'directory':
-                result.append(f"{name}/")
+        return target
+
+    def ls_chunks(self, target, offset=0, limit=None, chunk_size=LS_CHUNK):
+        """Порции вывода ls по уже отсортированным именам, без пересортировки
+
+        Начало страницы находится срезом по индексу, поэтому ls --offset
+        на огромной директории не перебирает предыдущие записи.
+        """
+        order = target['order']
+        children = target['children']
+        end = len(order) if limit is None else min(len(order), offset + limit)
+        for start in range(offset, end, chunk_size):
+            lines = []
+            for name in order[start:min(start + chunk_size, end)]:
+                item = children.get(name)
+                if item is None:
+                    # Запись удалена между порциями потокового вывода
+                    continue
+                lines.append(f"{name}/" if item['type'] == 'directory' else name)
+            yield "\n".join(lines)
+
+    def complete_path(self, text, offset=0, limit=None):
+        """Дополнение пути: (общий префикс совпадений, имена страницы, всего совпадений)
+
+        Префиксная структура - отсортированный список имен 'order', который
+        и так поддерживается при изменениях: совпадения занимают в нем
+        непрерывный диапазон, границы которого находятся бинарным поиском,
+        поэтому время не зависит от размера директории. Общий префикс
+        всех совпадений - общий префикс первого и последнего из них.
+        Имена директорий на странице - с '/' на конце.
+        """
+        head, slash, partial = text.rpartition('/')
+        node = self.get_node_by_path((head or '/') if slash else '.')
+        if not node or node['type'] != 'directory':
+            return partial, [], 0
+        if 'lazy' in node:
+            self._materialize(node)
+
+        order = node['order']
+        low, high = prefix_range(order, partial)
+        if low == high:
+            return partial, [], 0
+        common = os.path.commonprefix([order[low], order[high - 1]])
+
+        start = low + offset
+        end = high if limit is None else min(high, start + limit)
+        children = node['children']
+        page = [name + '/' if children[name]['type'] == 'directory' else name for name in order[start:end]]
+        return common, page, high - low
+
+    @staticmethod
+    def parse_ls_args(args):
+        """Аргументы ls: [--offset N] [--limit N] [путь]; ошибка - строкой"""
+        path = None
+        offset = 0
+        limit = None
+        i = 0
+        while i < len(args):
+            if args[i] in ('--offset', '--limit') and i + 1 < len(args):
+                if not args[i + 1].isdigit():
+                    return f"Ошибка: {args[i]} ожидает неотрицательное число"
+                if args[i] == '--offset':
+                    offset = int(args[i + 1])
+                else:
+                    limit = int(args[i + 1])
+                i += 2
+            elif path is None:
+                path = args[i]
+                i += 1
             else:
-                result.append(name)
-
-        return "\n".join(sorted(result))
+                i += 1
+        return path, offset, limit
 
     def cd(self, path):
         if not path:
             return ""
 
         if path == '/':
-            self.current_path = Path('/')
+            self.current_path = '/'
             return ""
         elif path == '..':
-            if self.current_path != Path('/'):
-                self.current_path = self.current_path.parent
+            if self.current_path != '/':
+                self.current_path = posixpath.dirname(self.current_path)
             return ""
         else:
             target = self.get_node_by_path(path)
             if target and target['type'] == 'directory':
-                # Обновляем current_path
-                if path.startswith('/'):
-                    self.current_path = Path(path)
-                else:
-                    self.current_path = self.current_path / path
-                # Нормализуем путь
-                self.current_path = self.current_path.resolve()
+                # Путь нормализуется внутри VFS, без обращения к файловой системе хоста
+                self.current_path = '/' + '/'.join(self._abs_parts(path))
                 return ""
             else:
                 return f"Ошибка: директория '{path}' не найдена"
@@ -296,7 +2154,9 @@ class VFS:
         return str(self.current_path)
 
     def wc(self, args):
-        """Подсчет строк, слов и символов в файлах"""
+        """Подсчет строк, слов и символов в файлах; wc -l - только строки (по индексу строк)"""
+        if args and args[0] == "-l":
+            return self.wc_lines(args[1:])
         if not args:
             return "Ошибка: укажите файл(ы) для анализа"
 
@@ -315,8 +2175,9 @@ class VFS:
                 results.append(f"Ошибка: '{filename}' не является файлом")
                 continue
 
-            content = file_node['content']
-            lines = content.count('\n') + (1 if content else 0)
+            content = self.read_content(file_node)
+            # Как line_count: строка без завершающего '\n' тоже считается
+            lines = content.count('\n') + (1 if content and not content.endswith('\n') else 0)
             words = len(re.findall(r'\S+', content))
             chars = len(content)
 
@@ -332,6 +2193,160 @@ class VFS:
 
         return "\n".join(results) if results else "Нет файлов для анализа"
 
+    def _file_arguments(self, args):
+        """Узлы файлов по путям: [(путь, узел или текст ошибки)]"""
+        files = []
+        for filename in args:
+            node = self.get_node_by_path(filename)
+            if not node:
+                files.append((filename, f"Ошибка: файл '{filename}' не найден"))
+            elif node['type'] != 'file':
+                files.append((filename, f"Ошибка: '{filename}' не является файлом"))
+            else:
+                files.append((filename, node))
+        return files
+
+    def wc_lines(self, args):
+        if not args:
+            return "Ошибка: укажите файл(ы) для анализа"
+        results = []
+        total = 0
+        for filename, node in self._file_arguments(args):
+            if isinstance(node, str):
+                results.append(node)
+                continue
+            lines = self.line_count(node)
+            total += lines
+            results.append(f"  {lines} {filename}")
+        if len(args) > 1:
+            results.append(f"  {total} total")
+        return "\n".join(results)
+
+    @staticmethod
+    def parse_line_count(args, default=10):
+        """-n N (или -nN) и файлы для head/tail"""
+        count = default
+        files = []
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg == "-n" and i + 1 < len(args):
+                value = args[i + 1]
+                i += 2
+            elif arg.startswith("-n") and len(arg) > 2:
+                value = arg[2:]
+                i += 1
+            else:
+                files.append(arg)
+                i += 1
+                continue
+            if not value.isdigit():
+                return f"Ошибка: неверное число строк '{value}'"
+            count = int(value)
+        if not files:
+            return "Ошибка: укажите файл(ы)"
+        return count, files
+
+    def head(self, args):
+        """head [-n N] ФАЙЛ...: первые N строк (по умолчанию 10)"""
+        return self._line_range_command(args, lambda total, count: (0, count))
+
+    def tail(self, args):
+        """tail [-n N] ФАЙЛ...: последние N строк; после первого обращения - O(N)"""
+        return self._line_range_command(args, lambda total, count: (max(0, total - count), total))
+
+    def _line_range_command(self, args, bounds):
+        parsed = self.parse_line_count(args)
+        if isinstance(parsed, str):
+            return parsed
+        count, filenames = parsed
+        results = []
+        for filename, node in self._file_arguments(filenames):
+            if isinstance(node, str):
+                results.append(node)
+                continue
+            if len(filenames) > 1:
+                # Заголовки, как у head/tail нескольких файлов
+                results.append(f"==> {filename} <==")
+            results.extend(self.read_lines(node, *bounds(self.line_count(node), count)))
+        return "\n".join(results)
+
+    def sed(self, args):
+        """sed -n 'Np' | 'A,Bp' | 'A,$p' ФАЙЛ: строки с A по B (с единицы)"""
+        usage = "Ошибка: использование: sed -n 'A,Bp' ФАЙЛ"
+        if len(args) != 3 or args[0] != "-n":
+            return usage
+        match = SED_RANGE_RE.fullmatch(args[1].strip("'\""))
+        if not match:
+            return usage
+        node = self._file_arguments(args[2:])[0][1]
+        if isinstance(node, str):
+            return node
+        first = int(match.group(1))
+        if first == 0:
+            return "Ошибка: номера строк начинаются с 1"
+        last = match.group(2)
+        if last is None:
+            last = first
+        elif last == '$':
+            last = self.line_count(node)
+        else:
+            last = int(last)
+        # Как в GNU sed: конец диапазона раньше начала - печатается только строка A
+        return "\n".join(self.read_lines(node, first - 1, max(last, first)))
+
+    def expand_glob(self, pattern):
+        """Пути, подходящие под шаблон с *, ? и [...], в отсортированном порядке
+
+        Компонент с подстановкой компилируется один раз и сопоставляется
+        с детьми директории; буквальный префикс до первого спецсимвола
+        сужает кандидатов бинарным поиском по отсортированному 'order'.
+        Как в shell, * и ? не подходят к именам, начинающимся с точки,
+        а шаблон без совпадений возвращается как есть.
+        """
+        import fnmatch
+
+        absolute = pattern.startswith('/')
+        paths = ['/' if absolute else '']
+        globbed = False
+        for part in pattern.split('/'):
+            if not part:
+                continue
+            if not GLOB_CHARS_RE.search(part):
+                paths = [self._join_glob(path, part) for path in paths]
+                continue
+
+            globbed = True
+            matcher = re.compile(fnmatch.translate(part)).match
+            prefix = part[:GLOB_CHARS_RE.search(part).start()]
+            expanded = []
+            for path in paths:
+                node = self.get_node_by_path(path or '.')
+                if not node or node['type'] != 'directory':
+                    continue
+                order = node['order']
+                for i in range(bisect.bisect_left(order, prefix), len(order)):
+                    name = order[i]
+                    if not name.startswith(prefix):
+                        break
+                    if name.startswith('.') and not prefix.startswith('.'):
+                        continue
+                    if matcher(name):
+                        expanded.append(self._join_glob(path, name))
+            paths = expanded
+
+        if not globbed:
+            return [pattern]
+        # Буквальные компоненты после подстановки могли указать на несуществующее
+        paths = [path for path in paths if self.get_node_by_path(path)]
+        return paths or [pattern]
+
+    @staticmethod
+    def _join_glob(path, name):
+        if not path:
+            return name
+        return f"{path}{name}" if path.endswith('/') else f"{path}/{name}"
+
     def find(self, args):
         """Поиск файлов и директорий"""
         if not args:
@@ -367,7 +2382,8 @@ class VFS:
             return f"Ошибка: путь '{search_path}' не найден"
 
         results = []
-        self._find_recursive(start_node, search_path, name_pattern, type_filter, results)
+        with TRACER.span('find.traverse', path=search_path):
+            self._find_recursive(start_node, search_path, name_pattern, type_filter, results)
 
         return "\n".join(results) if results else "Файлы не найдены"
 
@@ -378,6 +2394,8 @@ class VFS:
                     (not name_pattern or self._match_pattern(node['name'], name_pattern)):
                 results.append(current_path)
 
+            if 'lazy' in node:
+                self._materialize(node)
             for name, child in node['children'].items():
                 child_path = f"{current_path}/{name}" if current_path != '/' else f"/{name}"
                 self._find_recursive(child, child_path, name_pattern, type_filter, results)
@@ -393,20 +2411,39 @@ class VFS:
         pattern_re = re.escape(pattern).replace(r'\*', '.*').replace(r'\?', '.')
         return re.match(f'^{pattern_re}$', name) is not None
 
-    def cp(self, args):
-        """Копирование файлов и директорий"""
-        if len(args) < 2:
-            return "Ошибка: укажите источник и назначение"
+    def _apply_batch(self, args, apply):
+        """cp/mv с несколькими источниками: директория назначения разрешается один раз"""
+        dest_path = args[-1]
+        dest_dir = self.get_node_by_path(dest_path)
+        if not dest_dir or dest_dir['type'] != 'directory':
+            return f"Ошибка: при нескольких источниках '{dest_path}' должен быть директорией"
 
-        source_path = args[0]
-        dest_path = args[1]
+        results = []
+        # Подписчики получают изменения всех источников одним списком
+        with self.events.batch():
+            for source_path in args[:-1]:
+                name = self._source_name(source_path)
+                if name is None:
+                    results.append("Ошибка: корневую директорию нельзя скопировать или переместить")
+                    continue
+                results.append(apply(source_path, dest_dir, name, f"{dest_path.rstrip('/')}/{name}"))
+        return "\n".join(results)
 
-        # Получаем исходный узел
-        source_node = self.get_node_by_path(source_path)
-        if not source_node:
-            return f"Ошибка: источник '{source_path}' не найден"
+    def _source_name(self, source_path):
+        """Имя источника по нормализованному пути ('.', '..' разрешены); None - корень"""
+        parts = self._abs_parts(source_path)
+        return parts[-1] if parts else None
+
+    def _resolve_destination(self, source_path, dest_path):
+        """(директория, имя) назначения; в существующую директорию - под именем источника"""
+        source_name = self._source_name(source_path)
+        if source_name is None:
+            return "Ошибка: корневую директорию нельзя скопировать или переместить"
+
+        dest_node = self.get_node_by_path(dest_path)
+        if dest_node and dest_node['type'] == 'directory':
+            return dest_node, source_name
 
-        # Получаем родительскую директорию назначения и имя
         dest_parent, dest_name = self.get_parent_and_name(dest_path)
         if not dest_parent:
             return f"Ошибка: путь назначения '{dest_path}' недействителен"
@@ -416,7 +2453,28 @@ class VFS:
 
         # Если имя не указано, используем имя источника
         if not dest_name:
-            dest_name = Path(source_path).name
+            dest_name = source_name
+        return dest_parent, dest_name
+
+    def cp(self, args):
+        """Копирование файлов и директорий: cp ИСТОЧНИК НАЗНАЧЕНИЕ, cp ИСТОЧНИК... ДИРЕКТОРИЯ"""
+        if len(args) < 2:
+            return "Ошибка: укажите источник и назначение"
+
+        if len(args) > 2:
+            with TRACER.span('cp.batch', sources=len(args) - 1):
+                return self._apply_batch(args, self._copy_node)
+
+        destination = self._resolve_destination(args[0], args[1])
+        if isinstance(destination, str):
+            return destination
+        return self._copy_node(args[0], *destination, args[1])
+
+    def _copy_node(self, source_path, dest_parent, dest_name, dest_path):
+        # Получаем исходный узел
+        source_node = self.get_node_by_path(source_path)
+        if not source_node:
+            return f"Ошибка: источник '{source_path}' не найден"
 
         # Проверяем, существует ли уже цель
         if dest_name in dest_parent['children']:
@@ -426,56 +2484,61 @@ class VFS:
         try:
             if source_node['type'] == 'file':
                 # Копирование файла
-                new_file = {
-                    'type': 'file',
-                    'name': dest_name,
-                    'content': source_node['content'],
-                    'size': source_node['size']
-                }
-                dest_parent['children'][dest_name] = new_file
+                new_file = self._copy_file_node(source_node, dest_name)
+                self._attach(dest_parent, dest_name, new_file)
                 return f"Файл '{source_path}' скопирован в '{dest_path}'"
 
             elif source_node['type'] == 'directory':
                 # Рекурсивное копирование директории
-                new_dir = {
-                    'type': 'directory',
-                    'name': dest_name,
-                    'children': {}
-                }
-                self._copy_directory_recursive(source_node, new_dir)
-                dest_parent['children'][dest_name] = new_dir
+                new_dir = self._new_directory(dest_name)
+                with TRACER.span('cp.copy_tree', source=source_path):
+                    self._copy_directory_recursive(source_node, new_dir)
+                self._attach(dest_parent, dest_name, new_dir)
                 return f"Директория '{source_path}' скопирована в '{dest_path}'"
 
         except Exception as e:
             return f"Ошибка копирования: {e}"
 
     def _copy_directory_recursive(self, source_dir, dest_dir):
-        """Рекурсивное копирование директории"""
+        """Рекурсивное копирование директории
+
+        Агрегаты копии складываются из детей: в транзакции агрегаты
+        источника еще не содержат отложенных изменений.
+        """
+        dest_dir['order'] = list(source_dir['order'])
+        if 'hash' in source_dir and self.transaction is None:
+            dest_dir['hash'] = source_dir['hash']
         for name, child in source_dir['children'].items():
             if child['type'] == 'file':
-                dest_dir['children'][name] = {
-                    'type': 'file',
-                    'name': name,
-                    'content': child['content'],
-                    'size': child['size']
-                }
-            elif child['type'] == 'directory':
-                new_child_dir = {
-                    'type': 'directory',
-                    'name': name,
-                    'children': {}
-                }
-                self._copy_directory_recursive(child, new_child_dir)
-                dest_dir['children'][name] = new_child_dir
+                new_child = self._copy_file_node(child, name, dest_dir)
+            else:
+                new_child = self._new_directory(name, dest_dir)
+                if 'lazy' in child:
+                    # Копия заглушки - тоже заглушка на тот же фрагмент XML
+                    new_child['lazy'] = child['lazy']
+                    self.lazy_stubs += 1
+                self._copy_directory_recursive(child, new_child)
+            dest_dir['children'][name] = new_child
+            size, files, dirs = self._node_totals(new_child)
+            dest_dir['total_size'] += size
+            dest_dir['file_count'] += files
+            dest_dir['dir_count'] += dirs
 
     def mv(self, args):
-        """Перемещение/переименование файлов и директорий"""
+        """Перемещение/переименование: mv ИСТОЧНИК НАЗНАЧЕНИЕ, mv ИСТОЧНИК... ДИРЕКТОРИЯ"""
         if len(args) < 2:
             return "Ошибка: укажите источник и назначение"
 
-        source_path = args[0]
-        dest_path = args[1]
+        if len(args) > 2:
+            with TRACER.span('mv.batch', sources=len(args) - 1):
+                return self._apply_batch(args, self._move_node)
+
+        destination = self._resolve_destination(args[0], args[1])
+        if isinstance(destination, str):
+            return destination
+        return self._move_node(args[0], *destination, args[1])
 
+    def _move_node(self, source_path, dest_parent, dest_name, dest_path):
         # Получаем исходный узел и его родителя
         source_parent, source_name = self.get_parent_and_name(source_path)
         if not source_parent or source_name not in source_parent['children']:
@@ -483,64 +2546,43 @@ class VFS:
 
         source_node = source_parent['children'][source_name]
 
-        # Получаем родительскую директорию назначения и имя
-        dest_parent, dest_name = self.get_parent_and_name(dest_path)
-        if not dest_parent:
-            return f"Ошибка: путь назначения '{dest_path}' недействителен"
-
-        if dest_parent['type'] != 'directory':
-            return f"Ошибка: '{dest_path}' не является директорией"
-
-        # Если имя не указано, используем имя источника
-        if not dest_name:
-            dest_name = Path(source_path).name
-
         # Проверяем, не пытаемся ли переместить директорию в саму себя
         if source_node['type'] == 'directory':
-            dest_check = self.get_node_by_path(dest_path)
-            if dest_check and self._is_subdirectory(source_node, dest_check):
+            if self._is_subdirectory(source_node, dest_parent):
                 return f"Ошибка: нельзя переместить директорию в саму себя или поддиректорию"
 
         # Проверяем, существует ли уже цель
         if dest_name in dest_parent['children']:
+            if dest_parent is source_parent and dest_name == source_name:
+                return f"Ошибка: '{source_path}' и '{dest_path}' - один и тот же узел"
             return f"Ошибка: '{dest_path}' уже существует"
 
-        try:
-            # Удаляем исходный узел
-            del source_parent['children'][source_name]
-
-            # Создаем новый узел в назначении
-            if source_node['type'] == 'file':
-                dest_parent['children'][dest_name] = {
-                    'type': 'file',
-                    'name': dest_name,
-                    'content': source_node['content'],
-                    'size': source_node['size']
-                }
-            else:
-                # Для директории сохраняем детей
-                dest_parent['children'][dest_name] = {
-                    'type': 'directory',
-                    'name': dest_name,
-                    'children': source_node['children']
-                }
+        # Пакет шины: подписчики получают одно событие move вместо delete и create
+        with self.events.batch():
+            try:
+                # Узел переносится целиком: агрегаты вычитаются у старых предков
+                # и добавляются новым
+                self._detach(source_parent, source_name, moved=True)
+                source_node['name'] = dest_name
+                self._attach(dest_parent, dest_name, source_node, moved=True)
 
-            return f"'{source_path}' перемещен в '{dest_path}'"
+                return f"'{source_path}' перемещен в '{dest_path}'"
 
-        except Exception as e:
-            # В случае ошибки пытаемся восстановить исходный узел
-            source_parent['children'][source_name] = source_node
-            return f"Ошибка перемещения: {e}"
+            except Exception as e:
+                # В случае ошибки пытаемся восстановить исходный узел
+                if source_name not in source_parent['children']:
+                    source_node['name'] = source_name
+                    self._attach(source_parent, source_name, source_node, moved=True)
+                return f"Ошибка перемещения: {e}"
 
     def _is_subdirectory(self, parent_dir, potential_child):
-        """Проверяет, является ли potential_child поддиректорией parent_dir"""
-        # Простая проверка - если у parent_dir есть potential_child как прямой потомок
-        # В реальной реализации нужно было бы делать рекурсивную проверку
-        for name, child in parent_dir['children'].items():
-            if child == potential_child:
-                return True
-            if child['type'] == 'directory' and self._is_subdirectory(child, potential_child):
+        """Проверяет, является ли potential_child самой parent_dir или ее поддиректорией"""
+        # Подъем по ссылкам на родителя: O(глубины) вместо обхода поддерева
+        node = potential_child
+        while node is not None:
+            if node is parent_dir:
                 return True
+            node = node['parent']
         return False
 
     def mkdir(self, path):
@@ -562,18 +2604,830 @@ class VFS:
             return f"Ошибка: '{path}' уже существует"
 
         try:
-            parent['children'][dir_name] = {
-                'type': 'directory',
-                'name': dir_name,
-                'children': {}
-            }
+            self._attach(parent, dir_name, self._new_directory(dir_name))
             return f"Директория '{path}' создана"
         except Exception as e:
             return f"Ошибка создания директории: {e}"
 
+    def du(self, args):
+        """Размер поддеревьев по агрегатам, хранящимся в узлах директорий"""
+        summarize = False
+        human = False
+        paths = []
+
+        for arg in args:
+            if arg.startswith('-') and len(arg) > 1:
+                for flag in arg[1:]:
+                    if flag == 's':
+                        summarize = True
+                    elif flag == 'h':
+                        human = True
+                    else:
+                        return f"Ошибка: неизвестный флаг '-{flag}'"
+            else:
+                paths.append(arg)
+
+        if not paths:
+            paths = ['.']
+
+        results = []
+        for path in paths:
+            node = self.get_node_by_path(path)
+            if not node:
+                results.append(f"Ошибка: путь '{path}' не найден")
+                continue
+            self._materialize_tree(node)
+
+            if summarize or node['type'] == 'file':
+                # O(1): размер уже посчитан в узле
+                size = node['size'] if node['type'] == 'file' else node['total_size']
+                results.append(f"{self._format_size(size, human)}\t{path}")
+            else:
+                with TRACER.span('du.traverse', path=path):
+                    self._du_recursive(node, path, human, results)
+
+        return "\n".join(results)
+
+    def _du_recursive(self, node, current_path, human, results):
+        """Вывод всех поддиректорий (как du без -s), сначала вложенные"""
+        for name, child in node['children'].items():
+            if child['type'] == 'directory':
+                child_path = f"{current_path.rstrip('/')}/{name}"
+                self._du_recursive(child, child_path, human, results)
+        results.append(f"{self._format_size(node['total_size'], human)}\t{current_path}")
+
+    def get_text_index(self):
+        """Полнотекстовый индекс; при первом обращении строится по всему дереву"""
+        with self._index_lock:
+            if self.text_index is None:
+                with TRACER.span('index.build'):
+                    self._materialize_tree(self.root)
+                    index = TextIndex(self.read_content)
+                    index.add_tree(self.root)
+                self.text_index = index
+                self.events.subscribe(self._index_changes)
+            return self.text_index
+
+    def _index_changes(self, events):
+        """Подписчик шины: обновление полнотекстового индекса по событиям
+
+        Перенос индекс не затрагивает: пути вычисляются по ссылкам на родителя.
+        """
+        with self._index_lock:
+            self._update_index(events)
+
+    def _update_index(self, events):
+        index = self.text_index
+        if index is None:
+            return
+        # Поддерево добавленного предка уже содержит вложенные добавленные узлы
+        created = {id(node) for kind, node, _ in events if kind == 'create'} if len(events) > 1 else ()
+        for kind, node, detail in events:
+            if kind == 'create' or kind == 'expand':
+                if not created or not self._has_ancestor_in(node, created):
+                    index.add_tree(node)
+            elif kind == 'delete':
+                index.remove_tree(node)
+            elif kind == 'modify':
+                index.remove_file(node, detail)
+                index.add_file(node)
+            elif kind == 'reset':
+                self.events.unsubscribe(self._index_changes)
+                self.text_index = None
+                return
+
+    def search(self, args):
+        """search СЛОВО...: файлы, содержащие все слова (без учета регистра)"""
+        tokens = [token.lower() for arg in args for token in TOKEN_RE.findall(arg)]
+        if not tokens:
+            return "Ошибка: укажите слова для поиска"
+
+        with self._index_lock:
+            index = self.get_text_index()
+            files = list(index.files(index.match(tokens)))
+        paths = sorted(self.node_path(node) for node in files)
+        return "\n".join(paths) if paths else "Совпадений не найдено"
+
+    @staticmethod
+    def parse_grep_args(args):
+        """Флаги (в том числе слитные, -rl) до первого не-флага и остальные слова"""
+        flags = set()
+        words = []
+        for arg in args:
+            if arg.startswith('-') and len(arg) > 1 and not words:
+                flags.update(arg[1:])
+            else:
+                words.append(arg)
+        return flags, words
+
+    def grep(self, args):
+        """grep -F [-i] [-w] [-l] СТРОКА...: поиск фиксированной строки по индексу;
+        grep -r [-i] [-l|-c] ШАБЛОН [ПУТЬ]: регулярное выражение по поддереву
+
+        Для -F строка ищется как подстрока; кандидаты - файлы, где каждое ее
+        слово входит в какое-то слово текста. С -w строка совпадает только
+        целыми словами: кандидаты - файлы, где ее слова идут подряд. Затем
+        проверяются только строки кандидатов.
+        """
+        flags, words = self.parse_grep_args(args)
+
+        if 'r' in flags:
+            job = self.grep_snapshot(flags, words)
+            if isinstance(job, str):
+                return job
+            results = list(self.grep_scan(job))
+            return "\n".join(results) if results else "Совпадений не найдено"
+
+        if 'F' not in flags:
+            return "Ошибка: поддерживаются grep -F и grep -r"
+        if not words:
+            return "Ошибка: укажите строку для поиска"
+
+        pattern = ' '.join(words)
+        whole_words = 'w' in flags
+        if whole_words:
+            matcher = re.compile(r'(?<!\w)' + re.escape(pattern) + r'(?!\w)',
+                                 re.IGNORECASE if 'i' in flags else 0).search
+        elif 'i' in flags:
+            matcher = re.compile(re.escape(pattern), re.IGNORECASE).search
+        else:
+            def matcher(line):
+                return pattern in line
+
+        tokens = [token.lower() for token in TOKEN_RE.findall(pattern)]
+        with self._index_lock:
+            index = self.get_text_index()
+            if tokens:
+                keys = index.match(tokens, phrase=True) if whole_words else index.match_parts(tokens)
+                candidates = list(index.files(keys))
+            else:
+                # В строке нет слов - индекс не помогает, проверяем все файлы
+                candidates = list(index.files(list(index.documents)))
+
+        results = []
+        for node in sorted(candidates, key=self.node_path):
+            path = self.node_path(node)
+            lines = [line for line in self.read_content(node).split('\n') if matcher(line)]
+            if not lines:
+                continue
+            if 'l' in flags:
+                results.append(path)
+            else:
+                results.extend(f"{path}:{line}" for line in lines)
+
+        return "\n".join(results) if results else "Совпадений не найдено"
+
+    def grep_snapshot(self, flags, words):
+        """Задание grep -r: шаблон компилируется один раз, файлы - в порядке путей
+
+        Вызывается под блокировкой чтения; дальше сканирование идет по
+        снимку (содержимое неизменяемо), уже без блокировки.
+        """
+        if not words:
+            return "Ошибка: укажите шаблон"
+        try:
+            pattern = re.compile(words[0], re.IGNORECASE if 'i' in flags else 0)
+        except re.error as e:
+            return f"Ошибка: неверный шаблон: {e}"
+
+        path = words[1] if len(words) > 1 else '.'
+        node = self.get_node_by_path(path)
+        if not node:
+            return f"Ошибка: путь '{path}' не найден"
+        self._materialize_tree(node)
+
+        entries = []
+        base = self.node_path(node)
+        if node['type'] == 'file':
+            entries.append((base, node['content'], node.get('codec')))
+        else:
+            self._collect_files(node, base.rstrip('/'), entries)
+
+        mode = 'l' if 'l' in flags else 'c' if 'c' in flags else 'lines'
+        return pattern, mode, entries
+
+    def _collect_files(self, node, path, entries):
+        for name in node['order']:
+            child = node['children'][name]
+            if child['type'] == 'file':
+                entries.append((f"{path}/{name}", child['content'], child.get('codec')))
+            else:
+                self._collect_files(child, f"{path}/{name}", entries)
+
+    def grep_scan(self, job, workers=None):
+        """Вывод grep -r по файлам в порядке путей, по мере готовности
+
+        Крупные задания делятся на диапазоны и сканируются пулом процессов
+        (fork: дочерние процессы получают снимок без сериализации); imap
+        сохраняет порядок, поэтому результаты идут в порядке путей.
+        """
+        global _GREP_JOB
+        import multiprocessing
+
+        pattern, mode, entries = job
+        workers = workers or os.cpu_count() or 1
+        total = sum(len(data) for _, data, _ in entries)
+        if workers < 2 or total < GREP_PARALLEL_MIN or 'fork' not in multiprocessing.get_all_start_methods():
+            for entry in entries:
+                output = grep_entry(pattern, mode, entry)
+                if output:
+                    yield output
+            return
+
+        with TRACER.span('grep.parallel', files=len(entries), workers=workers):
+            with _GREP_LOCK:
+                _GREP_JOB = job
+                try:
+                    with multiprocessing.get_context('fork').Pool(workers) as pool:
+                        for outputs in pool.imap(_grep_worker, _grep_chunks(entries, workers * 4)):
+                            for output in outputs:
+                                if output:
+                                    yield output
+                finally:
+                    _GREP_JOB = None
+
+    # Подсистемы VFS для разбивки выделений памяти tracemalloc
+    MEMORY_SUBSYSTEMS = {
+        'loader': ('load_from_xml', '_parse_xml_element', 'vfs_init', '_rebuild_totals'),
+        'content': ('_decode_content', '_store_content', 'read_content'),
+        'cp': ('cp', '_copy_directory_recursive', 'mv', 'mkdir', '_attach', '_detach'),
+    }
+
+    def vfs_stats(self, args):
+        """Учет памяти: узлы по типам, объем содержимого, накладные расходы узлов"""
+        dirs = files = stubs = 0
+        content_chars = content_memory = 0
+        compressed_files = compressed_chars = compressed_memory = 0
+        host_files = host_bytes = 0
+        dir_overhead = file_overhead = name_memory = 0
+        by_object = {}
+        by_value = {}
+
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            name_memory += sys.getsizeof(node['name'])
+            if node['type'] == 'directory':
+                dirs += 1
+                stubs += 'lazy' in node
+                dir_overhead += sys.getsizeof(node) + sys.getsizeof(node['children']) + sys.getsizeof(node['order'])
+                stack.extend(node['children'].values())
+            else:
+                files += 1
+                file_overhead += sys.getsizeof(node)
+                content = node['content']
+                memory = sys.getsizeof(content)
+                content_chars += node['size']
+                content_memory += memory
+                if node.get('codec') == 'host':
+                    host_files += 1
+                    host_bytes += node['size']
+                elif 'codec' in node:
+                    compressed_files += 1
+                    compressed_chars += node['size']
+                    compressed_memory += len(content)
+                # cp разделяет строки содержимого, поэтому считаем и по объектам,
+                # и по значениям (потенциал дедупликации)
+                by_object[id(content)] = memory
+                by_value[content] = memory
+
+        fmt = lambda size: self._format_size(size, True)
+        lines = [
+            f"Узлы: {dirs} директорий, {files} файлов, всего {dirs + files}",
+            f"Содержимое: {content_chars} символов, {fmt(content_memory)} в памяти",
+            f"Уникальное содержимое: {fmt(sum(by_object.values()))} по объектам, "
+            f"{fmt(sum(by_value.values()))} по значениям",
+            f"Накладные расходы узлов: директория ~{fmt(dir_overhead // max(dirs, 1))}, "
+            f"файл ~{fmt(file_overhead // max(files, 1))}, "
+            f"всего {fmt(dir_overhead + file_overhead)} + имена {fmt(name_memory)}",
+        ]
+        if stubs:
+            lines.append(f"Не развернуто (ленивая загрузка): {stubs} директорий")
+        if host_files:
+            lines.append(f"Не загружено с хоста (import): {host_files} файлов, {fmt(host_bytes)}")
+        if self.compression or compressed_files:
+            cache = self.content_cache
+            requests = cache.hits + cache.misses
+            ratio = compressed_chars / compressed_memory if compressed_memory else 0
+            lines.append(f"Сжатие ({self.compression}, от {self.compress_min} символов): {compressed_files} файлов, "
+                         f"{compressed_chars} символов -> {fmt(compressed_memory)}, коэффициент {ratio:.2f}")
+            lines.append(f"Кэш содержимого: {cache.hits}/{requests} попаданий "
+                         f"({cache.hits * 100 / requests if requests else 0:.1f}%), "
+                         f"занято {fmt(cache.size)} из {fmt(cache.max_size)}")
+        if len(self.line_index):
+            lines.append(f"Индекс строк (head/tail/sed/wc -l): {len(self.line_index)} файлов, "
+                         f"{fmt(self.line_index.memory())}")
+
+        if '-m' in args:
+            lines.append(self._tracemalloc_breakdown())
+
+        return "\n".join(lines)
+
+    def _tracemalloc_breakdown(self):
+        """Живые выделения памяти по подсистемам VFS (по стеку выделения)"""
+        import inspect
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+            return ("Трассировка памяти запущена; повторите vfs-stats -m после операций "
+                    "(для учета загрузки запускайте с --tracemalloc)")
+
+        filename = os.path.abspath(__file__)
+        ranges = []
+        for subsystem, functions in self.MEMORY_SUBSYSTEMS.items():
+            for function in functions:
+                lines, first = inspect.getsourcelines(getattr(VFS, function))
+                ranges.append((first, first + len(lines), subsystem))
+
+        totals = {}
+        for stat in tracemalloc.take_snapshot().statistics('traceback'):
+            subsystem = 'прочее'
+            # Ближайший к месту выделения кадр из функций VFS определяет подсистему
+            for frame in reversed(stat.traceback):
+                if frame.filename != filename:
+                    continue
+                found = next((name for first, last, name in ranges if first <= frame.lineno < last), None)
+                if found:
+                    subsystem = found
+                    break
+            size, count = totals.get(subsystem, (0, 0))
+            totals[subsystem] = (size + stat.size, count + stat.count)
+
+        lines = ["Выделения памяти (tracemalloc):"]
+        for subsystem, (size, count) in sorted(totals.items(), key=lambda item: -item[1][0]):
+            lines.append(f"  {subsystem:<10} {self._format_size(size, True):>10} в {count} блоках")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _format_size(size, human):
+        """Размер в байтах или в читаемом виде (K, M, G, T)"""
+        if not human:
+            return str(size)
+        value = float(size)
+        for unit in ('B', 'K', 'M', 'G'):
+            if value < 1024:
+                return f"{value:.0f}{unit}" if unit == 'B' else f"{value:.1f}{unit}"
+            value /= 1024
+        return f"{value:.1f}T"
+
+
+class CommandStats:
+    """Задержки команд по имени: счетчики и гистограмма по степеням двойки (мкс)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.commands = {}
+
+    def record(self, cmd, seconds):
+        bucket = int(seconds * 1_000_000).bit_length()
+        with self._lock:
+            entry = self.commands.get(cmd)
+            if entry is None:
+                entry = self.commands[cmd] = {'count': 0, 'total': 0.0, 'max': 0.0, 'buckets': {}}
+            entry['count'] += 1
+            entry['total'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['buckets'][bucket] = entry['buckets'].get(bucket, 0) + 1
+
+    def report(self):
+        with self._lock:
+            snapshot = {cmd: dict(entry, buckets=dict(entry['buckets'])) for cmd, entry in self.commands.items()}
+
+        if not snapshot:
+            return "Статистика пуста"
+
+        lines = []
+        for cmd, entry in sorted(snapshot.items()):
+            mean = entry['total'] / entry['count']
+            lines.append(f"{cmd}: {entry['count']} вызовов, среднее {format_duration(mean)}, "
+                         f"макс {format_duration(entry['max'])}")
+            peak = max(entry['buckets'].values())
+            for bucket in sorted(entry['buckets']):
+                low = 0 if bucket == 0 else 1 << (bucket - 1)
+                count = entry['buckets'][bucket]
+                bar = '#' * max(1, count * 30 // peak)
+                lines.append(f"  {low:>9}-{(1 << bucket):<9} мкс {count:>7} {bar}")
+        return "\n".join(lines)
+
+
+def format_duration(seconds):
+    if seconds < 0.001:
+        return f"{seconds * 1_000_000:.1f} мкс"
+    if seconds < 1:
+        return f"{seconds * 1000:.3f} мс"
+    return f"{seconds:.3f} с"
+
+
+# Общая статистика процесса: ее пополняют все сеансы (GUI, скрипты, сервер)
+COMMAND_STATS = CommandStats()
+
+
+def first_error(result):
+    """Первая строка вывода команды, сообщающая об ошибке, или None"""
+    return next((line for line in result.split("\n")
+                 if line.startswith(("Ошибка", "Команда не найдена"))), None)
+
+
+class ShellSession:
+    """Сеанс работы с общей VFS: своя текущая директория и разбор команд"""
+
+    # Команды только читают дерево и выполняются параллельно;
+    # остальные берут VFS монопольно
+    READ_COMMANDS = {"ls", "cd", "pwd", "wc", "head", "tail", "sed", "find", "du", "vfs-stats", "search", "grep",
+                     "vfs-export", "vfs-diff"}
+
+    # Команды, аргументы которых раскрываются по шаблонам (*, ?, [...]);
+    # шаблоны find -name, grep и search - их собственный синтаксис
+    GLOB_COMMANDS = {"cd", "wc", "head", "tail", "cp", "mv", "du"}
+
+    # Имена команд для дополнения по Tab (отсортированы для бинарного поиска)
+    COMMAND_NAMES = sorted(READ_COMMANDS | {
+        "cp", "mv", "mkdir", "vfs-init", "import", "begin", "commit", "rollback",
+        "time", "bench", "stats", "exit",
+    })
+
+    # Кандидатов дополнения на странице
+    COMPLETION_PAGE = 40
+
+    # Номера сеансов в журнале записи
+    _session_ids = itertools.count(1)
+
+    def __init__(self, vfs, stats=None):
+        self.vfs = vfs
+        self.cwd = '/'
+        self.stats = stats if stats is not None else COMMAND_STATS
+        self.session_id = next(self._session_ids)
+
+    def execute(self, command):
+        """Выполнить строку команды в контексте сеанса и вернуть вывод"""
+        if not RECORDER.enabled:
+            return self._execute(command)
+        start = time.perf_counter_ns()
+        try:
+            return self._execute(command)
+        finally:
+            RECORDER.record(self.session_id, command, start, time.perf_counter_ns())
+
+    def _execute(self, command):
+        parts = command.split()
+        cmd = parts[0].lower() if parts else ""
+        args = parts[1:] if len(parts) > 1 else []
+
+        # VFS хранит одну текущую директорию, поэтому на время команды
+        # подставляем директорию сеанса
+        saved_path = self.vfs.current_path
+        self.vfs.current_path = self.cwd
+        try:
+            return self.dispatch(cmd, args)
+        finally:
+            self.cwd = self.vfs.current_path
+            self.vfs.current_path = saved_path
+
+    def dispatch(self, cmd, args):
+        """Команды измерения обрабатываются здесь, остальные - с замером задержки"""
+        if cmd == "time":
+            return self.time_command(args)
+        elif cmd == "bench":
+            return self.bench_command(args)
+        elif cmd == "stats":
+            if args and args[0] == "reset":
+                self.stats.reset()
+                return "Статистика сброшена"
+            return self.stats.report()
+
+        with TRACER.span(cmd, 'command', args=' '.join(args)):
+            start = time.perf_counter()
+            result = self.run_locked(cmd, args)
+            self.stats.record(cmd, time.perf_counter() - start)
+        return result
+
+    def execute_stream(self, command):
+        """Как execute, но вывод ls и grep -r выдается порциями по мере формирования"""
+        if not RECORDER.enabled:
+            yield from self._execute_stream(command)
+            return
+        start = time.perf_counter_ns()
+        try:
+            yield from self._execute_stream(command)
+        finally:
+            RECORDER.record(self.session_id, command, start, time.perf_counter_ns())
+
+    def _execute_stream(self, command):
+        parts = command.split()
+        cmd = parts[0].lower() if parts else ""
+        args = parts[1:]
+        if self.vfs.transaction is not None:
+            # Проверки транзакции выполняются в обычном пути команды
+            yield self._execute(command)
+            return
+        if cmd == "grep" and 'r' in self.vfs.parse_grep_args(args)[0]:
+            stream = self._stream_grep(args)
+        elif cmd == "ls":
+            stream = self._stream_ls(args)
+        else:
+            yield self._execute(command)
+            return
+
+        # Тот же замер, что в dispatch; время включает и обработку порций получателем
+        with TRACER.span(cmd, 'command', args=' '.join(args)):
+            start = time.perf_counter()
+            yield from stream
+            self.stats.record(cmd, time.perf_counter() - start)
+
+    def _stream_ls(self, args):
+        parsed = self.vfs.parse_ls_args(args)
+        if isinstance(parsed, str):
+            yield parsed
+            return
+        path, offset, limit = parsed
+
+        saved_path = self.vfs.current_path
+        self.vfs.current_path = self.cwd
+        try:
+            with self.vfs.lock.read():
+                target = self.vfs.ls_target(path)
+        finally:
+            self.vfs.current_path = saved_path
+        if isinstance(target, str):
+            yield target
+            return
+
+        # Блокировка берется на каждую порцию, а не на весь вывод
+        chunks = self.vfs.ls_chunks(target, offset, limit)
+        while True:
+            with self.vfs.lock.read():
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            yield chunk
+
+    def _stream_grep(self, args):
+        flags, words = self.vfs.parse_grep_args(args)
+        saved_path = self.vfs.current_path
+        self.vfs.current_path = self.cwd
+        try:
+            with self.vfs.lock.read():
+                job = self.vfs.grep_snapshot(flags, words)
+        finally:
+            self.vfs.current_path = saved_path
+        if isinstance(job, str):
+            yield job
+            return
+
+        found = False
+        for output in self.vfs.grep_scan(job):
+            found = True
+            yield output
+        if not found:
+            yield "Совпадений не найдено"
+
+    def run_locked(self, cmd, args):
+        lock = self.vfs.lock.read() if cmd in self.READ_COMMANDS else self.vfs.lock.write()
+        with lock:
+            transaction = self.vfs.transaction
+            if transaction is not None and transaction.owner is not self:
+                # Чужие сеансы не видят незавершенных изменений
+                return "Ошибка: VFS занята транзакцией другого сеанса"
+            if cmd in self.GLOB_COMMANDS:
+                # Раскрытие под той же блокировкой, что и выполнение команды
+                args = [path for arg in args
+                        for path in (self.vfs.expand_glob(arg) if GLOB_CHARS_RE.search(arg) else [arg])]
+            if transaction is not None:
+                return self.run_in_transaction(transaction, cmd, args)
+            return self.run(cmd, args)
+
+    def run_in_transaction(self, transaction, cmd, args):
+        """Команда в своей транзакции (под уже взятой блокировкой)
+
+        Ошибка любого шага сразу откатывает транзакцию.
+        """
+        if cmd in ("commit", "rollback"):
+            return self.run(cmd, args)
+        if transaction.failed:
+            return (f"Ошибка: транзакция отменена ({transaction.failed}); "
+                    f"завершите ее командой commit или rollback")
+        if cmd in ("begin", "vfs-init"):
+            return f"Ошибка: {cmd} недоступна внутри транзакции"
+
+        if cmd in self.READ_COMMANDS:
+            # Чтения внутри транзакции видят ее изменения в агрегатах и индексе
+            self.vfs.flush_transaction()
+            return self.run(cmd, args)
+
+        result = self.run(cmd, args)
+        transaction.operations += 1
+        failure = first_error(result)
+        if failure:
+            self.vfs.abort_transaction(f"{cmd}: {failure}")
+            result += "\nТранзакция отменена; завершите ее командой commit или rollback"
+        return result
+
+    def complete(self, line, page=0):
+        """Дополнение последнего слова строки по Tab
+
+        Первое слово дополняется по именам команд, остальные - по путям VFS
+        относительно директории сеанса. Возвращает строку с дописанным общим
+        префиксом (и '/' или пробелом при единственном совпадении), страницу
+        кандидатов и их общее число.
+        """
+        head, _, word = line.rpartition(' ')
+        first_word = not head.strip()
+        offset = page * self.COMPLETION_PAGE
+        before = line[:len(line) - len(word)]
+
+        if first_word:
+            low, high = prefix_range(self.COMMAND_NAMES, word.lower())
+            names = self.COMMAND_NAMES[low:high]
+            common = os.path.commonprefix([names[0], names[-1]]) if names else word
+            candidates = names[offset:offset + self.COMPLETION_PAGE]
+            total = high - low
+            completed = before + common
+            if total == 1:
+                completed += ' '
+            return completed, candidates, total
+
+        saved_path = self.vfs.current_path
+        self.vfs.current_path = self.cwd
+        try:
+            with self.vfs.lock.read():
+                transaction = self.vfs.transaction
+                if transaction is not None and transaction.owner is not self:
+                    return line, [], 0
+                common, candidates, total = self.vfs.complete_path(word, offset, self.COMPLETION_PAGE)
+        finally:
+            self.vfs.current_path = saved_path
+
+        completed = before + word[:len(word) - len(word.rpartition('/')[2])] + common
+        if total == 1:
+            completed += '/' if candidates and candidates[0].endswith('/') else ' '
+        return completed, candidates, total
+
+    def time_command(self, args):
+        """time <команда>: вывод команды, затем реальное и процессорное время"""
+        if not args:
+            return "Ошибка: укажите команду"
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        result = self.dispatch(args[0].lower(), args[1:])
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+        timing = f"real\t{format_duration(wall)}\ncpu\t{format_duration(cpu)}"
+        return f"{result}\n{timing}" if result else timing
+
+    def bench_command(self, args):
+        """bench N <команда>: N повторов без вывода, min/медиана/p99"""
+        if len(args) < 2 or not args[0].isdigit() or int(args[0]) < 1:
+            return "Ошибка: использование bench N <команда>"
+
+        runs = int(args[0])
+        cmd = args[1].lower()
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            self.dispatch(cmd, args[2:])
+            timings.append(time.perf_counter() - start)
+
+        timings.sort()
+        median = timings[len(timings) // 2]
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        return (f"{runs} запусков '{' '.join(args[1:])}': min {format_duration(timings[0])}, "
+                f"медиана {format_duration(median)}, p99 {format_duration(p99)}")
+
+    def run(self, cmd, args):
+        """Диспетчер команд VFS (без команд интерфейса вроде exit)"""
+        if cmd == "ls":
+            parsed = self.vfs.parse_ls_args(args)
+            if isinstance(parsed, str):
+                return parsed
+            return self.vfs.ls(*parsed)
+        elif cmd == "cd":
+            return self.vfs.cd(args[0] if args else "")
+        elif cmd == "pwd":
+            return self.vfs.pwd()
+        elif cmd == "wc":
+            return self.vfs.wc(args)
+        elif cmd == "head":
+            return self.vfs.head(args)
+        elif cmd == "tail":
+            return self.vfs.tail(args)
+        elif cmd == "sed":
+            return self.vfs.sed(args)
+        elif cmd == "find":
+            return self.vfs.find(args)
+        elif cmd == "cp":
+            return self.vfs.cp(args)
+        elif cmd == "mv":
+            return self.vfs.mv(args)
+        elif cmd == "mkdir":
+            return self.vfs.mkdir(args[0] if args else "")
+        elif cmd == "du":
+            return self.vfs.du(args)
+        elif cmd == "vfs-init":
+            return self.vfs.vfs_init()
+        elif cmd == "vfs-stats":
+            return self.vfs.vfs_stats(args)
+        elif cmd == "search":
+            return self.vfs.search(args)
+        elif cmd == "grep":
+            return self.vfs.grep(args)
+        elif cmd == "import":
+            return self.vfs.import_tree(args)
+        elif cmd == "vfs-export":
+            return self.vfs.vfs_export(args)
+        elif cmd == "vfs-diff":
+            return self.vfs.vfs_diff(args)
+        elif cmd == "begin":
+            return self.vfs.begin(owner=self)
+        elif cmd == "commit":
+            return self.vfs.commit()
+        elif cmd == "rollback":
+            return self.vfs.rollback()
+        else:
+            return f"Команда не найдена: {cmd}"
+
+
+class VFSServer:
+    """Asyncio-сервер: одна VFS в памяти, отдельный сеанс на каждое подключение
+
+    Протокол: клиент шлет команду одной строкой, сервер отвечает строкой
+    с длиной ответа в байтах и затем самим ответом в UTF-8.
+    Команды выполняются в пуле потоков: долгая команда одного клиента не
+    останавливает цикл событий, а разделение доступа к VFS - дело RWLock.
+    """
+
+    # Потоков выполнения команд (одновременно выполняемых команд)
+    WORKERS = 32
+
+    def __init__(self, vfs, socket_path):
+        self.vfs = vfs
+        self.socket_path = socket_path
+        self.sessions = 0
+        self.executor = None
+
+    async def handle_client(self, reader, writer):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        session = ShellSession(self.vfs)
+        self.sessions += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                command = line.decode('utf-8', errors='replace').strip()
+                if command.lower() == "exit":
+                    break
+
+                try:
+                    output = await loop.run_in_executor(self.executor, session.execute, command) if command else ""
+                except Exception as e:
+                    # Сбой одной команды (например, исчезнувший файл хоста) не закрывает сеанс
+                    output = f"Ошибка выполнения команды: {e}"
+                data = output.encode('utf-8')
+                writer.write(f"{len(data)}\n".encode('ascii') + data)
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            # Незавершенная транзакция отключившегося клиента откатывается
+            if self.vfs.transaction is not None and self.vfs.transaction.owner is session:
+                await loop.run_in_executor(self.executor, session.execute, "rollback")
+            self.sessions -= 1
+            writer.close()
+
+    async def serve_forever(self):
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        self.executor = ThreadPoolExecutor(self.WORKERS, thread_name_prefix='vfs-session')
+        server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+        print(f"VFS сервер слушает {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(wait=False)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
 
 class Terminal_Emulator:
-    def __init__(self, root, vfs_path=None, prompt="$ ", script_path=None):
+    def __init__(self, root, vfs_path=None, prompt="$ ", script_path=None, vfs=None):
+        import tkinter as tk
+        from tkinter import scrolledtext
+
         self.root = root
         self.root.title("MyVFS Emulator")
 
@@ -581,8 +3435,9 @@ class Terminal_Emulator:
         self.custom_prompt = prompt
         self.script_path = script_path
 
-        self.vfs = VFS()
+        self.vfs = vfs if vfs is not None else VFS()
         self.vfs_loaded = False
+        self.session = ShellSession(self.vfs)
 
         self.debug_output()
 
@@ -604,6 +3459,10 @@ class Terminal_Emulator:
         self.input_entry = tk.Entry(input_frame)
         self.input_entry.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=(5, 5))
         self.input_entry.bind("<Return>", self.process_command)
+        self.input_entry.bind("<Tab>", self.complete_input)
+        # Повторный Tab на той же строке листает страницы кандидатов
+        self.completion_line = None
+        self.completion_page = 0
 
         self.run_button = tk.Button(input_frame, text="Run", command=self.process_command)
         self.run_button.pack(side=tk.RIGHT)
@@ -659,47 +3518,49 @@ class Terminal_Emulator:
     def process_script_command(self, command):
         parts = command.split()
         cmd = parts[0].lower() if parts else ""
-        args = parts[1:] if len(parts) > 1 else []
 
         if cmd == "exit":
             self.root.after(100, self.root.destroy)
-        elif cmd == "ls":
-            result = self.vfs.ls(args[0] if args else None)
-            self.print_output(f"{result}\n")
-        elif cmd == "cd":
-            result = self.vfs.cd(args[0] if args else "")
+            return
+
+        for result in self.session.execute_stream(command):
             if result:
                 self.print_output(f"{result}\n")
-        elif cmd == "pwd":
-            result = self.vfs.pwd()
-            self.print_output(f"{result}\n")
-        elif cmd == "wc":
-            result = self.vfs.wc(args)
-            self.print_output(f"{result}\n")
-        elif cmd == "find":
-            result = self.vfs.find(args)
-            self.print_output(f"{result}\n")
-        elif cmd == "cp":
-            result = self.vfs.cp(args)
-            self.print_output(f"{result}\n")
-        elif cmd == "mv":
-            result = self.vfs.mv(args)
-            self.print_output(f"{result}\n")
-        elif cmd == "mkdir":
-            result = self.vfs.mkdir(args[0] if args else "")
-            self.print_output(f"{result}\n")
-        elif cmd == "vfs-init":
-            result = self.vfs.vfs_init()
-            self.print_output(f"{result}\n")
-        else:
-            self.print_output(f"Команда не найдена: {cmd}\n")
 
     def print_output(self, text):
+        import tkinter as tk
+
         self.output_area.configure(state='normal')
         self.output_area.insert(tk.END, text)
         self.output_area.see(tk.END)
         self.output_area.configure(state='disabled')
 
+    def complete_input(self, event=None):
+        line = self.input_entry.get()
+        if line == self.completion_line:
+            self.completion_page += 1
+        else:
+            self.completion_page = 0
+
+        completed, candidates, total = self.session.complete(line, self.completion_page)
+        if total and not candidates:
+            # Страницы закончились: начинаем сначала
+            self.completion_page = 0
+            completed, candidates, total = self.session.complete(line, 0)
+
+        if completed != line:
+            self.input_entry.delete(0, 'end')
+            self.input_entry.insert(0, completed)
+        if total > 1:
+            first = self.completion_page * ShellSession.COMPLETION_PAGE
+            more = ", Tab - дальше" if first + len(candidates) < total else ""
+            self.print_output("  ".join(candidates) +
+                              f"\n({first + 1}-{first + len(candidates)} из {total}{more})\n")
+        # Листать можно только уже показанный список кандидатов
+        self.completion_line = self.input_entry.get() if total > 1 else None
+        # Tab не должен переводить фокус на кнопку
+        return "break"
+
     def process_command(self, event=None):
         command = self.input_entry.get().strip()
         if not command:
@@ -707,67 +3568,93 @@ class Terminal_Emulator:
 
         self.print_output(f"{self.custom_prompt}{command}\n")
 
-        self.input_entry.delete(0, tk.END)
+        self.input_entry.delete(0, 'end')
 
         parts = command.split()
         cmd = parts[0].lower() if parts else ""
-        args = parts[1:] if len(parts) > 1 else []
 
         if cmd == "exit":
             self.root.destroy()
-        elif cmd == "ls":
-            result = self.vfs.ls(args[0] if args else None)
-            self.print_output(f"{result}\n")
-        elif cmd == "cd":
-            result = self.vfs.cd(args[0] if args else "")
+            return
+
+        for result in self.session.execute_stream(command):
             if result:
                 self.print_output(f"{result}\n")
-        elif cmd == "pwd":
-            result = self.vfs.pwd()
-            self.print_output(f"{result}\n")
-        elif cmd == "wc":
-            result = self.vfs.wc(args)
-            self.print_output(f"{result}\n")
-        elif cmd == "find":
-            result = self.vfs.find(args)
-            self.print_output(f"{result}\n")
-        elif cmd == "cp":
-            result = self.vfs.cp(args)
-            self.print_output(f"{result}\n")
-        elif cmd == "mv":
-            result = self.vfs.mv(args)
-            self.print_output(f"{result}\n")
-        elif cmd == "mkdir":
-            result = self.vfs.mkdir(args[0] if args else "")
-            self.print_output(f"{result}\n")
-        elif cmd == "vfs-init":
-            result = self.vfs.vfs_init()
+        if cmd == "vfs-init":
             self.vfs_loaded = True
-            self.print_output(f"{result}\n")
-        else:
-            self.print_output(f"Команда не найдена: {cmd}\n")
+
+
+def int_argument(flag, value, minimum=0):
+    """Целое значение параметра командной строки не меньше minimum"""
+    try:
+        number = int(value)
+    except ValueError:
+        number = None
+    if number is None or number < minimum:
+        raise ValueError(f"{flag}: ожидается целое число не меньше {minimum}, получено '{value}'")
+    return number
 
 
 def parse_arguments():
-    vfs_path = None
-    prompt = "$ "
-    script_path = None
+    """Параметры командной строки; неверное значение числового параметра - ValueError"""
+    options = {
+        'vfs_path': None,
+        'prompt': "$ ",
+        'script_path': None,
+        'server_path': None,
+        'trace_path': None,
+        'record_path': None,
+        'tracemalloc': False,
+        'lazy_depth': None,
+        'compression': None,
+        'compress_min': 4096,
+        'cache_size': 16 * 1024 * 1024,
+        'load_workers': None,
+        'write_test_script': False,
+        'startup_probe': False,
+    }
+    value_flags = {
+        "--vfs": 'vfs_path',
+        "--prompt": 'prompt',
+        "--script": 'script_path',
+        "--server": 'server_path',
+        "--trace": 'trace_path',
+        "--record": 'record_path',
+    }
 
     i = 1
     while i < len(sys.argv):
-        if sys.argv[i] == "--vfs" and i + 1 < len(sys.argv):
-            vfs_path = sys.argv[i + 1]
+        if sys.argv[i] in value_flags and i + 1 < len(sys.argv):
+            options[value_flags[sys.argv[i]]] = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--tracemalloc":
+            options['tracemalloc'] = True
+            i += 1
+        elif sys.argv[i] == "--write-test-script":
+            options['write_test_script'] = True
+            i += 1
+        elif sys.argv[i] == "--startup-probe":
+            options['startup_probe'] = True
+            i += 1
+        elif sys.argv[i] == "--lazy-depth" and i + 1 < len(sys.argv):
+            options['lazy_depth'] = int_argument("--lazy-depth", sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--compress" and i + 1 < len(sys.argv):
+            options['compression'] = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--compress-min" and i + 1 < len(sys.argv):
+            options['compress_min'] = int_argument("--compress-min", sys.argv[i + 1])
             i += 2
-        elif sys.argv[i] == "--prompt" and i + 1 < len(sys.argv):
-            prompt = sys.argv[i + 1]
+        elif sys.argv[i] == "--content-cache" and i + 1 < len(sys.argv):
+            options['cache_size'] = int_argument("--content-cache", sys.argv[i + 1])
             i += 2
-        elif sys.argv[i] == "--script" and i + 1 < len(sys.argv):
-            script_path = sys.argv[i + 1]
+        elif sys.argv[i] == "--load-workers" and i + 1 < len(sys.argv):
+            options['load_workers'] = int_argument("--load-workers", sys.argv[i + 1], minimum=1)
             i += 2
         else:
             i += 1
 
-    return vfs_path, prompt, script_path
+    return options
 
 
 def create_test_script_stage5():
@@ -840,15 +3727,101 @@ echo "=== Тестирование завершено ==="
     print("Тестовый скрипт для этапа 5 создан: test_script_stage5.txt")
 
 
-def main():
-    vfs_path, prompt, script_path = parse_arguments()
+def create_vfs(options):
+    """VFS с параметрами представления из командной строки"""
+    return VFS(
+        lazy_depth=options['lazy_depth'],
+        compression=options['compression'],
+        compress_min=options['compress_min'],
+        cache_size=options['cache_size'],
+        load_workers=options['load_workers']
+    )
+
+
+def run_server(vfs_path, socket_path, vfs):
+    """Серверный режим без графического интерфейса"""
+    import asyncio
 
-    # Создаем тестовый скрипт для этапа 5 если его нет
-    if not os.path.exists("test_script_stage5.txt"):
+    if vfs_path:
+        success, message = vfs.load_from_xml(vfs_path)
+        if not success:
+            print(f"Ошибка загрузки VFS: {message}")
+            return
+        print(f"VFS загружена: {message}")
+    else:
+        print(vfs.vfs_init())
+
+    try:
+        asyncio.run(VFSServer(vfs, socket_path).serve_forever())
+    except KeyboardInterrupt:
+        print("Сервер остановлен")
+
+
+def startup_probe(vfs_path, prompt, script_path, vfs):
+    """Довести запуск до готового приглашения и сразу выйти (замер холодного старта)"""
+    import tkinter as tk
+
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        # Без дисплея замеряем все, кроме создания окна
+        root = None
+
+    if root is not None:
+        Terminal_Emulator(root, vfs_path, prompt, script_path, vfs)
+        root.update_idletasks()
+        root.destroy()
+    elif vfs_path:
+        vfs.load_from_xml(vfs_path)
+    else:
+        vfs.vfs_init()
+
+    print("startup-probe: приглашение готово")
+
+
+def main():
+    try:
+        options = parse_arguments()
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+        return
+    vfs_path, prompt, script_path = options['vfs_path'], options['prompt'], options['script_path']
+
+    if options['tracemalloc']:
+        import tracemalloc
+
+        # До загрузки VFS, чтобы vfs-stats -m учитывал выделения загрузчика
+        tracemalloc.start(25)
+
+    if options['trace_path']:
+        TRACER.start(options['trace_path'])
+
+    if options['record_path']:
+        RECORDER.start(options['record_path'], vfs_path)
+
+    try:
+        vfs = create_vfs(options)
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+        return
+
+    if options['server_path']:
+        run_server(vfs_path, options['server_path'], vfs)
+        return
+
+    # Тестовый скрипт этапа 5 создается только по запросу: запуск
+    # не должен писать файлы
+    if options['write_test_script'] and not os.path.exists("test_script_stage5.txt"):
         create_test_script_stage5()
 
+    if options['startup_probe']:
+        startup_probe(vfs_path, prompt, script_path, vfs)
+        return
+
+    import tkinter as tk
+
     root = tk.Tk()
-    app = Terminal_Emulator(root, vfs_path, prompt, script_path)
+    app = Terminal_Emulator(root, vfs_path, prompt, script_path, vfs)
     root.mainloop()
 
 
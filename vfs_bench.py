@@ -0,0 +1,566 @@
+import base64
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from xml.sax.saxutils import escape, quoteattr
+
+from vfs_module import load_emulator
+
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+         "incididunt ut labore et dolore magna aliqua\n").split(" ")
+TEXT_BLOCK = " ".join(WORDS * 64)
+
+
+class ImageGenerator:
+    """Потоковая генерация XML-образа VFS заданной формы
+
+    Дерево пишется в файл по мере обхода, поэтому образы на миллионы
+    узлов не требуют памяти под все дерево.
+    """
+
+    def __init__(self, depth=3, fanout=5, files=10, size_dist="fixed:256", binary_ratio=0.0, seed=1):
+        self.depth = depth
+        self.fanout = fanout
+        self.files = files
+        self.size_dist = size_dist
+        self.binary_ratio = binary_ratio
+        self.rng = random.Random(seed)
+        self.dirs_written = 0
+        self.files_written = 0
+        self.content_bytes = 0
+
+    def _content_size(self):
+        kind, *params = self.size_dist.split(":")
+        if kind == "fixed":
+            return int(params[0])
+        if kind == "uniform":
+            return self.rng.randint(int(params[0]), int(params[1]))
+        if kind == "lognormal":
+            return int(self.rng.lognormvariate(float(params[0]), float(params[1])))
+        raise ValueError(f"Неизвестное распределение размеров: {self.size_dist}")
+
+    def _content(self, size):
+        block = TEXT_BLOCK * (size // len(TEXT_BLOCK) + 1)
+        offset = self.rng.randrange(len(TEXT_BLOCK))
+        return block[offset:offset + size] if offset + size <= len(block) else block[:size]
+
+    def _write_directory(self, out, level, indent):
+        pad = "  " * indent
+        for i in range(self.files):
+            content = self._content(self._content_size())
+            self.files_written += 1
+            self.content_bytes += len(content)
+            name = quoteattr(f"f{i}.txt")
+            if self.rng.random() < self.binary_ratio:
+                data = base64.b64encode(content.encode('utf-8')).decode('ascii')
+                out.write(f'{pad}<file name={name} encoding="base64">{data}</file>\n')
+            else:
+                out.write(f'{pad}<file name={name}>{escape(content)}</file>\n')
+
+        if level >= self.depth:
+            return
+        for i in range(self.fanout):
+            self.dirs_written += 1
+            out.write(f'{pad}<directory name="d{i}">\n')
+            self._write_directory(out, level + 1, indent + 1)
+            out.write(f'{pad}</directory>\n')
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8", buffering=1 << 20) as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n<vfs>\n')
+            self._write_directory(out, 0, 1)
+            out.write('</vfs>\n')
+        return {
+            "path": path,
+            "bytes": os.path.getsize(path),
+            "directories": self.dirs_written,
+            "files": self.files_written,
+            "content_bytes": self.content_bytes,
+            "shape": {"depth": self.depth, "fanout": self.fanout, "files": self.files,
+                      "size_dist": self.size_dist, "binary_ratio": self.binary_ratio},
+        }
+
+    def _write_host_directory(self, path, level):
+        for i in range(self.files):
+            content = self._content(self._content_size())
+            self.files_written += 1
+            self.content_bytes += len(content)
+            with open(os.path.join(path, f"f{i}.txt"), "w", encoding="utf-8") as f:
+                f.write(content)
+
+        if level >= self.depth:
+            return
+        for i in range(self.fanout):
+            self.dirs_written += 1
+            child = os.path.join(path, f"d{i}")
+            os.mkdir(child)
+            self._write_host_directory(child, level + 1)
+
+    def write_tree(self, path):
+        """То же дерево директорией на хосте (источник для import)"""
+        os.makedirs(path)
+        self._write_host_directory(path, 0)
+        return {"path": path, "directories": self.dirs_written, "files": self.files_written,
+                "content_bytes": self.content_bytes}
+
+
+def peak_rss_kb():
+    # ru_maxrss в Linux - килобайты, в macOS - байты
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "min": min(timings),
+        "mean": sum(timings) / len(timings),
+        "repeat": repeat,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def deepest_directory(vfs):
+    parts = []
+    node = vfs.root
+    while True:
+        subdirs = sorted(name for name, child in node['children'].items() if child['type'] == 'directory')
+        if not subdirs:
+            return "/" + "/".join(parts)
+        parts.append(subdirs[0])
+        node = node['children'][subdirs[0]]
+
+
+def run_suite(image_path, repeat=3):
+    """Время основных операций на образе; каждая - через ShellSession, как в эмуляторе"""
+    module = load_emulator()
+    vfs = module.VFS()
+    session = module.ShellSession(vfs)
+    results = {}
+
+    rss_before = peak_rss_kb()
+    start = time.perf_counter()
+    success, message = vfs.load_from_xml(image_path)
+    elapsed = time.perf_counter() - start
+    results["load_from_xml"] = {
+        "min": elapsed,
+        "mean": elapsed,
+        "repeat": 1,
+        "peak_rss_kb": peak_rss_kb(),
+        "rss_growth_kb": peak_rss_kb() - rss_before,
+    }
+    if not success:
+        raise RuntimeError(message)
+
+    deep = deepest_directory(vfs)
+    top = next((name for name, child in sorted(vfs.root['children'].items())
+                if child['type'] == 'directory'), None)
+    sample_files = [f"{deep}/{name}" for name, child in vfs.get_node_by_path(deep)['children'].items()
+                    if child['type'] == 'file'][:10]
+
+    results["ls"] = measure(lambda: session.execute(f"ls {deep}"), repeat)
+    results["ls /"] = measure(lambda: session.execute("ls /"), repeat)
+    results["cd"] = measure(lambda: (session.execute(f"cd {deep}"), session.execute("cd /")), repeat)
+    results["find"] = measure(lambda: session.execute("find / -name f0.txt"), repeat)
+    results["complete"] = measure(lambda: session.complete(f"ls {deep}/f"), repeat)
+    if sample_files:
+        results["wc"] = measure(lambda: session.execute("wc " + " ".join(sample_files)), repeat)
+
+    if top:
+        state = {"n": 0}
+
+        def copy_tree():
+            state["n"] += 1
+            session.execute(f"cp /{top} /bench_copy{state['n']}")
+
+        def move_tree():
+            session.execute(f"mv /bench_copy{state['n']} /bench_moved{state['n']}")
+            session.execute(f"mv /bench_moved{state['n']} /bench_copy{state['n']}")
+
+        results["cp"] = measure(copy_tree, repeat)
+        results["mv"] = measure(move_tree, repeat)
+
+    return results
+
+
+def run_import_suite(generator, workdir, lazy_above=None):
+    """Файлов в секунду: import директории и tar против генерации XML и load_from_xml
+
+    Генератор с одним seed дает одинаковые деревья для всех вариантов.
+    """
+    module = load_emulator()
+    host_dir = os.path.join(workdir, "tree")
+    tree = generator().write_tree(host_dir)
+    tar_path = os.path.join(workdir, "tree.tar")
+    with tarfile.open(tar_path, "w") as tar:
+        tar.add(host_dir, arcname="tree")
+    files = tree["files"]
+    lazy = [] if lazy_above is None else ["--lazy-above", str(lazy_above)]
+
+    def timed(func):
+        rss_before = peak_rss_kb()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        return {"min": elapsed, "mean": elapsed, "repeat": 1, "files_per_s": files / elapsed,
+                "peak_rss_kb": peak_rss_kb(), "rss_growth_kb": peak_rss_kb() - rss_before}
+
+    def xml_load():
+        image_path = os.path.join(workdir, "tree.xml")
+        generator().write(image_path)
+        success, message = module.VFS().load_from_xml(image_path)
+        if not success:
+            raise RuntimeError(message)
+
+    def importer(source, workers=None):
+        def run():
+            vfs = module.VFS()
+            vfs.vfs_init()
+            threads = [] if workers is None else ["-j", str(workers)]
+            result = vfs.import_tree(threads + lazy + [source, "/imported"])
+            if result.startswith("Ошибка"):
+                raise RuntimeError(result)
+        return run
+
+    results = {"xml generate+load": timed(xml_load)}
+    results["import dir -j 1"] = timed(importer(host_dir, 1))
+    results["import dir"] = timed(importer(host_dir))
+    results["import tar"] = timed(importer(tar_path))
+    return tree, results
+
+
+def provisioning_script(vfs, count):
+    """Типичный сценарий развертывания: каталоги, копии файлов и поддеревьев, переименования"""
+    deep = deepest_directory(vfs)
+    sample = next(name for name, child in vfs.get_node_by_path(deep)['children'].items()
+                  if child['type'] == 'file')
+    commands = ["mkdir /provisioned"]
+    for i in range(count):
+        commands += [
+            f"mkdir /provisioned/{i}",
+            f"cp {deep}/{sample} /provisioned/{i}/config",
+            f"cp {deep} /provisioned/{i}/data",
+            f"mv /provisioned/{i}/config /provisioned/{i}/config.bak",
+            f"mkdir /provisioned/{i}/data/logs",
+        ]
+    return commands
+
+
+def run_transaction_suite(image_path, count, repeat=3):
+    """Сценарий развертывания командами по одной и внутри begin/commit
+
+    Перед замером строится полнотекстовый индекс, чтобы учесть и его
+    обновления; каждый прогон выполняется на свежезагруженной VFS,
+    варианты чередуются, чтобы шум машины влиял на них одинаково.
+    Итоговое дерево после commit должно совпадать с деревом без транзакции.
+    """
+    module = load_emulator()
+    variants = (("unbatched", False), ("begin/commit", True))
+    timings = {label: [] for label, _ in variants}
+    commands_count = {}
+    trees = {}
+    for _ in range(repeat):
+        for label, batched in variants:
+            vfs = module.VFS()
+            success, message = vfs.load_from_xml(image_path)
+            if not success:
+                raise RuntimeError(message)
+            session = module.ShellSession(vfs)
+            session.execute("search lorem")
+            commands = provisioning_script(vfs, count)
+            if batched:
+                commands = ["begin"] + commands + ["commit"]
+            commands_count[label] = len(commands)
+
+            start = time.perf_counter()
+            for command in commands:
+                session.execute(command)
+            timings[label].append(time.perf_counter() - start)
+            root = vfs.root
+            trees[label] = (vfs.tree_hash(root), root['total_size'], root['file_count'], root['dir_count'])
+
+        if len(set(trees.values())) > 1:
+            raise RuntimeError("дерево после begin/commit отличается от дерева без транзакции: "
+                               + ", ".join(f"{label}: {tree[1]} байт, {tree[2]} файлов, {tree[3]} директорий"
+                                           for label, tree in trees.items()))
+
+    return {label: {"min": min(values), "mean": sum(values) / len(values), "repeat": repeat,
+                    "peak_rss_kb": peak_rss_kb(), "commands_per_s": commands_count[label] / min(values)}
+            for label, values in timings.items()}
+
+
+def run_load_suite(image_path, workers_list, repeat=3):
+    """Время load_from_xml при разборе участков верхнего уровня в N процессах
+
+    N=1 - обычная загрузка в текущем процессе. Число ядер машины
+    ограничивает ускорение: при N больше ядер процессы делят их.
+    """
+    module = load_emulator()
+    results = {}
+    for workers in workers_list:
+        def load():
+            vfs = module.VFS(load_workers=workers)
+            success, message = vfs.load_from_xml(image_path)
+            if not success:
+                raise RuntimeError(message)
+
+        results[f"load -j {workers}"] = measure(load, repeat)
+    baseline = results[f"load -j {workers_list[0]}"]["min"]
+    for result in results.values():
+        result["speedup"] = baseline / result["min"]
+    return results
+
+
+def suite_script(vfs, index):
+    """Сценарий набора: в основном чтение дерева и одна запись"""
+    deep = deepest_directory(vfs)
+    return "\n".join([
+        f"# сценарий {index}",
+        "ls /",
+        f"cd {deep}",
+        "ls",
+        "du -s /",
+        f"mkdir /script_{index}",
+        f"cp {deep} /script_{index}/data",
+        "find -name *.txt",
+        "",
+    ])
+
+
+def run_script_suite(image_path, count, workdir):
+    """Набор из count сценариев: по очереди с загрузкой образа на каждый
+    против vfs_runner (образ загружается один раз, сценарии в fork-процессах)"""
+    import vfs_runner
+
+    module = load_emulator()
+    vfs = module.VFS()
+    success, message = vfs.load_from_xml(image_path)
+    if not success:
+        raise RuntimeError(message)
+    scripts = []
+    for i in range(count):
+        path = os.path.join(workdir, f"script_{i:04d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(suite_script(vfs, i))
+        scripts.append(path)
+    del vfs
+
+    variants = [("sequential", 1, True)]
+    jobs = 1
+    while jobs <= (os.cpu_count() or 1):
+        variants.append((f"fork -j {jobs}", jobs, False))
+        jobs *= 2
+
+    results = {}
+    for label, jobs, sequential in variants:
+        out_dir = tempfile.mkdtemp(dir=workdir)
+        statuses, elapsed = vfs_runner.run_suite(image_path, scripts, jobs, out_dir, sequential)
+        failed = sum(1 for status, _ in statuses if status != vfs_runner.STATUS_OK)
+        if failed:
+            raise RuntimeError(f"{label}: {failed} сценариев завершились с ошибкой, вывод в {out_dir}")
+        results[label] = {"min": elapsed, "mean": elapsed, "repeat": 1,
+                          "peak_rss_kb": peak_rss_kb(), "scripts_per_s": count / elapsed}
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    for name, result in results.items():
+        rate = ""
+        if "files_per_s" in result:
+            rate = f"   {result['files_per_s']:10.0f} файлов/с"
+        elif "commands_per_s" in result:
+            rate = f"   {result['commands_per_s']:10.0f} команд/с"
+        elif "scripts_per_s" in result:
+            rate = f"   {result['scripts_per_s']:10.1f} сценариев/с"
+        elif "speedup" in result:
+            rate = f"   x{result['speedup']:.2f}"
+        print(f"  {name:<18} min {result['min'] * 1000:10.3f} мс   "
+              f"mean {result['mean'] * 1000:10.3f} мс   peak RSS {result['peak_rss_kb'] / 1024:8.1f} МБ{rate}")
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"{'операция':<16} {old.get('label') or old_path:>14} {new.get('label') or new_path:>14}  изменение")
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            continue
+        before = old["results"][name]["min"]
+        after = result["min"]
+        ratio = after / before if before else float("inf")
+        print(f"{name:<16} {before * 1000:12.3f}мс {after * 1000:12.3f}мс  x{ratio:.2f}")
+
+
+def parse_arguments():
+    options = {
+        "command": sys.argv[1] if len(sys.argv) > 1 else "help",
+        "paths": [],
+        "depth": 3,
+        "fanout": 5,
+        "files": 10,
+        "size_dist": "fixed:256",
+        "binary_ratio": 0.0,
+        "seed": 1,
+        "repeat": 3,
+        "out": None,
+        "label": None,
+        "lazy_above": None,
+        "count": 1000,
+        "workers": [1, 2, 4, 8],
+        "unknown": [],
+    }
+    int_flags = {"--depth": "depth", "--fanout": "fanout", "--files": "files", "--seed": "seed", "--repeat": "repeat",
+                 "--count": "count"}
+
+    i = 2
+    while i < len(sys.argv):
+        arg = sys.argv[i]
+        if arg in int_flags and i + 1 < len(sys.argv):
+            options[int_flags[arg]] = int(sys.argv[i + 1])
+            i += 2
+        elif arg == "--size-dist" and i + 1 < len(sys.argv):
+            options["size_dist"] = sys.argv[i + 1]
+            i += 2
+        elif arg == "--binary-ratio" and i + 1 < len(sys.argv):
+            options["binary_ratio"] = float(sys.argv[i + 1])
+            i += 2
+        elif arg == "--out" and i + 1 < len(sys.argv):
+            options["out"] = sys.argv[i + 1]
+            i += 2
+        elif arg == "--label" and i + 1 < len(sys.argv):
+            options["label"] = sys.argv[i + 1]
+            i += 2
+        elif arg == "--workers" and i + 1 < len(sys.argv):
+            options["workers"] = [int(value) for value in sys.argv[i + 1].split(",")]
+            i += 2
+        elif arg == "--lazy-above" and i + 1 < len(sys.argv):
+            options["lazy_above"] = int(sys.argv[i + 1])
+            i += 2
+        elif arg.startswith("-"):
+            # Неизвестный флаг или флаг без значения - не путь к образу
+            options["unknown"].append(arg)
+            i += 1
+        else:
+            options["paths"].append(arg)
+            i += 1
+
+    return options
+
+
+USAGE = """Использование:
+  python vfs_bench.py generate OUT.xml [--depth N] [--fanout N] [--files N]
+                      [--size-dist fixed:N|uniform:A:B|lognormal:MU:SIGMA] [--binary-ratio F] [--seed N]
+  python vfs_bench.py run [IMAGE.xml] [параметры generate] [--repeat N] [--out RESULT.json] [--label NAME]
+  python vfs_bench.py import [параметры generate] [--lazy-above БАЙТ]
+  python vfs_bench.py txn [IMAGE.xml] [параметры generate] [--count N]
+  python vfs_bench.py scripts [IMAGE.xml] [параметры generate] [--count N]
+  python vfs_bench.py load [IMAGE.xml] [параметры generate] [--workers 1,2,4,8] [--repeat N]
+  python vfs_bench.py compare OLD.json NEW.json"""
+
+
+def main():
+    options = parse_arguments()
+    command = options["command"]
+    if options["unknown"]:
+        help_requested = set(options["unknown"]) <= {"-h", "--help"}
+        if not help_requested:
+            print(f"Ошибка: неизвестный параметр или параметр без значения: {' '.join(options['unknown'])}")
+        print(USAGE)
+        sys.exit(0 if help_requested else 2)
+
+    def generator():
+        return ImageGenerator(options["depth"], options["fanout"], options["files"],
+                              options["size_dist"], options["binary_ratio"], options["seed"])
+
+    def image_argument():
+        if options["paths"]:
+            image_path = options["paths"][0]
+            return image_path, {"path": image_path, "bytes": os.path.getsize(image_path)}
+        # Без готового образа генерируем временный по параметрам командной строки
+        image_path = os.path.join(tempfile.mkdtemp(), "bench_image.xml")
+        return image_path, generator().write(image_path)
+
+    if command == "generate" and options["paths"]:
+        image = generator().write(options["paths"][0])
+        print(f"Образ {image['path']}: {image['directories']} директорий, {image['files']} файлов, "
+              f"{image['bytes'] / 1024 / 1024:.1f} МБ")
+
+    elif command == "run":
+        image_path, image = image_argument()
+        results = run_suite(image_path, options["repeat"])
+        report = {
+            "label": options["label"] or git_revision(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "image": image,
+            "results": results,
+        }
+        print(f"Образ: {image_path} ({image['bytes'] / 1024 / 1024:.1f} МБ)")
+        print_results(results)
+
+        if options["out"]:
+            with open(options["out"], "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"Результаты сохранены: {options['out']}")
+
+    elif command == "import":
+        tree, results = run_import_suite(generator, tempfile.mkdtemp(), options["lazy_above"])
+        print(f"Дерево: {tree['directories']} директорий, {tree['files']} файлов, "
+              f"{tree['content_bytes'] / 1024 / 1024:.1f} МБ содержимого")
+        print_results(results)
+
+    elif command == "txn":
+        image_path, image = image_argument()
+        results = run_transaction_suite(image_path, options["count"], options["repeat"])
+        print(f"Образ: {image_path} ({image['bytes'] / 1024 / 1024:.1f} МБ), "
+              f"сценарий: {options['count']} групп по 5 команд")
+        print_results(results)
+
+    elif command == "scripts":
+        image_path, image = image_argument()
+        results = run_script_suite(image_path, options["count"], tempfile.mkdtemp())
+        print(f"Образ: {image_path} ({image['bytes'] / 1024 / 1024:.1f} МБ), "
+              f"сценариев: {options['count']}, ядер: {os.cpu_count()}")
+        print_results(results)
+
+    elif command == "load":
+        image_path, image = image_argument()
+        results = run_load_suite(image_path, options["workers"], options["repeat"])
+        print(f"Образ: {image_path} ({image['bytes'] / 1024 / 1024:.1f} МБ), ядер: {os.cpu_count()}")
+        print_results(results)
+
+    elif command == "compare" and len(options["paths"]) == 2:
+        compare(*options["paths"])
+
+    else:
+        print(USAGE)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import socket
+import sys
+
+
+class VFSClient:
+    """Тонкий клиент VFS-сервера (python practice1.4.py --server SOCKET)"""
+
+    def __init__(self, socket_path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.stream = self.sock.makefile('rb')
+
+    def execute(self, command):
+        """Отправить команду и дождаться ответа: строка с длиной, затем данные"""
+        self.sock.sendall(command.encode('utf-8') + b"\n")
+        header = self.stream.readline()
+        if not header:
+            raise ConnectionError("Сервер закрыл соединение")
+        return self.stream.read(int(header)).decode('utf-8')
+
+    def close(self):
+        try:
+            self.sock.sendall(b"exit\n")
+        except OSError:
+            pass
+        self.stream.close()
+        self.sock.close()
+
+
+def parse_arguments():
+    socket_path = "vfs.sock"
+    prompt = "$ "
+    commands = []
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--socket" and i + 1 < len(sys.argv):
+            socket_path = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--prompt" and i + 1 < len(sys.argv):
+            prompt = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "-c" and i + 1 < len(sys.argv):
+            commands.append(sys.argv[i + 1])
+            i += 2
+        else:
+            i += 1
+
+    return socket_path, prompt, commands
+
+
+def main():
+    socket_path, prompt, commands = parse_arguments()
+
+    try:
+        client = VFSClient(socket_path)
+    except OSError as e:
+        print(f"Ошибка подключения к {socket_path}: {e}")
+        sys.exit(1)
+
+    try:
+        if commands:
+            for command in commands:
+                output = client.execute(command)
+                if output:
+                    print(output)
+            return
+
+        # Интерактивный режим; при перенаправленном вводе выполняется как скрипт
+        interactive = sys.stdin.isatty()
+        while True:
+            try:
+                line = input(prompt if interactive else "")
+            except EOFError:
+                break
+
+            command = line.strip()
+            if not command or command.startswith("#"):
+                continue
+            if command.lower() == "exit":
+                break
+
+            output = client.execute(command)
+            if output:
+                print(output)
+    except (ConnectionError, OSError) as e:
+        print(f"Соединение потеряно: {e}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Смесь команд одного сеанса: навигация, чтение и немного изменений
+SESSION_COMMANDS = [
+    "pwd",
+    "ls /",
+    "cd /home/user/documents",
+    "ls",
+    "wc readme.txt notes.txt",
+    "cd ..",
+    "find -name *.txt",
+    "du -s /",
+    "mkdir /tmp/s{session}_{step}",
+    "ls /tmp",
+]
+
+
+async def send_command(reader, writer, command):
+    writer.write(command.encode('utf-8') + b"\n")
+    await writer.drain()
+    header = await reader.readline()
+    await reader.readexactly(int(header))
+
+
+async def run_session(socket_path, session, commands_per_session, latencies):
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    try:
+        for step in range(commands_per_session):
+            template = SESSION_COMMANDS[step % len(SESSION_COMMANDS)]
+            command = template.format(session=session, step=step)
+            start = time.perf_counter()
+            await send_command(reader, writer, command)
+            latencies.append(time.perf_counter() - start)
+        writer.write(b"exit\n")
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def run_load(socket_path, sessions, commands_per_session):
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_session(socket_path, session, commands_per_session, latencies)
+        for session in range(sessions)
+    ))
+    return time.perf_counter() - start, latencies
+
+
+def wait_for_socket(socket_path, process, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if os.path.exists(socket_path):
+            return True
+        if process.poll() is not None:
+            return False
+        time.sleep(0.05)
+    return False
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+def parse_arguments():
+    sessions = 100
+    commands = 200
+    vfs_path = None
+    socket_path = None
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--sessions" and i + 1 < len(sys.argv):
+            sessions = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--commands" and i + 1 < len(sys.argv):
+            commands = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--vfs" and i + 1 < len(sys.argv):
+            vfs_path = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--socket" and i + 1 < len(sys.argv):
+            socket_path = sys.argv[i + 1]
+            i += 2
+        else:
+            i += 1
+
+    return sessions, commands, vfs_path, socket_path
+
+
+def main():
+    """Нагрузочный тест: N одновременных сеансов против одного VFS-сервера
+
+    Без --socket запускает собственный сервер во временной директории.
+    """
+    sessions, commands, vfs_path, socket_path = parse_arguments()
+
+    process = None
+    if not socket_path:
+        socket_path = os.path.join(tempfile.mkdtemp(), "vfs.sock")
+        server_cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "practice1.4.py"),
+                      "--server", socket_path]
+        if vfs_path:
+            server_cmd += ["--vfs", vfs_path]
+        process = subprocess.Popen(server_cmd, stdout=subprocess.DEVNULL)
+        if not wait_for_socket(socket_path, process):
+            print("Ошибка: сервер не запустился")
+            process.kill()
+            sys.exit(1)
+
+    try:
+        elapsed, latencies = asyncio.run(run_load(socket_path, sessions, commands))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"Сеансов: {sessions}, команд: {total}, время: {elapsed:.3f} с")
+    print(f"Пропускная способность: {total / elapsed:.0f} команд/с")
+    print(f"Задержка: p50={percentile(latencies, 0.5) * 1000:.2f} мс, "
+          f"p99={percentile(latencies, 0.99) * 1000:.2f} мс, "
+          f"max={latencies[-1] * 1000:.2f} мс")
+
+
+if __name__ == "__main__":
+    main()
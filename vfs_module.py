@@ -0,0 +1,19 @@
+import importlib.util
+import os
+import sys
+
+
+MODULE_NAME = "practice1_4"
+
+
+def load_emulator():
+    """Импорт practice1.4.py как модуля (имя файла содержит точку)"""
+    if MODULE_NAME in sys.modules:
+        return sys.modules[MODULE_NAME]
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "practice1.4.py")
+    spec = importlib.util.spec_from_file_location(MODULE_NAME, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[MODULE_NAME] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,198 @@
+import json
+import sys
+import time
+
+from vfs_module import load_emulator
+
+
+def read_log(path):
+    """Заголовок и команды журнала --record в порядке начала выполнения
+
+    Команда: (смещение, записанная длительность в секундах, сеанс, строка).
+    """
+    module = load_emulator()
+    with open(path, "r", encoding="utf-8") as f:
+        header = f.readline().rstrip("\n").split("\t")
+        if header[0] != module.SessionRecorder.HEADER:
+            raise ValueError(f"не журнал сеанса: {path}")
+        entries = []
+        for line in f:
+            offset, duration, session_id, command = line.rstrip("\n").split("\t", 3)
+            entries.append((int(offset) / 1_000_000, int(duration) / 1_000_000, int(session_id), command))
+
+    # Записи попадают в журнал по завершении команды; выполнять их нужно по началу
+    entries.sort(key=lambda entry: entry[0])
+    return {"started": header[1] if len(header) > 1 else "",
+            "vfs_path": header[2] if len(header) > 2 else ""}, entries
+
+
+def replay(entries, vfs_path=None, paced=False, speed=1.0, transcript=None):
+    """Выполнить команды журнала в одном потоке и вернуть задержки по командам
+
+    Каждый записанный сеанс получает свой ShellSession, поэтому текущие
+    директории не смешиваются. Команды одновременных сеансов выполняются
+    строго по порядку начала: воспроизведение детерминировано.
+    paced выдерживает исходные паузы между командами (ускоренные в speed раз).
+    """
+    module = load_emulator()
+    vfs = module.VFS()
+    if vfs_path:
+        success, message = vfs.load_from_xml(vfs_path)
+        if not success:
+            raise ValueError(f"Ошибка загрузки VFS: {message}")
+    else:
+        # Без образа эмулятор стартует с демонстрационной VFS
+        vfs.vfs_init()
+
+    stats = module.CommandStats()
+    sessions = {}
+    latencies = []
+    # Пауза до первой команды (загрузка, ожидание клиентов) не воспроизводится
+    first = entries[0][0] if entries else 0.0
+    origin = time.perf_counter()
+    for offset, recorded, session_id, command in entries:
+        if paced:
+            delay = origin + (offset - first) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        session = sessions.get(session_id)
+        if session is None:
+            session = sessions[session_id] = module.ShellSession(vfs, stats=stats)
+
+        start = time.perf_counter()
+        # Тот же путь, что у терминала: вывод ls и grep -r порциями
+        output = "\n".join(chunk for chunk in session.execute_stream(command) if chunk)
+        latencies.append((command, recorded, time.perf_counter() - start))
+        if transcript:
+            transcript.write(f"[{session_id}] {command}\n{output}\n")
+
+    return latencies, time.perf_counter() - origin
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+
+def summarize(latencies):
+    """Задержки воспроизведения по имени команды вместе с записанными"""
+    groups = {}
+    for command, recorded, elapsed in latencies:
+        name = command.split()[0].lower() if command.split() else ""
+        group = groups.setdefault(name, {"replay": [], "recorded": 0.0})
+        group["replay"].append(elapsed)
+        group["recorded"] += recorded
+
+    results = {}
+    for name, group in sorted(groups.items()):
+        values = sorted(group["replay"])
+        total = sum(values)
+        results[name] = {
+            "count": len(values),
+            "min": values[0],
+            "mean": total / len(values),
+            "p50": percentile(values, 0.5),
+            "p99": percentile(values, 0.99),
+            "max": values[-1],
+            "total": total,
+            "recorded_total": group["recorded"],
+        }
+    return results
+
+
+def print_report(results, latencies, wall, top):
+    print(f"{'команда':<12} {'число':>7} {'p50':>10} {'p99':>10} {'max':>10} {'всего':>10} {'записано':>10}  x")
+    for name, result in results.items():
+        ratio = result["total"] / result["recorded_total"] if result["recorded_total"] else float("inf")
+        print(f"{name:<12} {result['count']:>7} {result['p50'] * 1000:>8.3f}мс {result['p99'] * 1000:>8.3f}мс "
+              f"{result['max'] * 1000:>8.3f}мс {result['total'] * 1000:>8.1f}мс "
+              f"{result['recorded_total'] * 1000:>8.1f}мс  {ratio:.2f}")
+
+    if top:
+        print("\nСамые медленные команды:")
+        for command, recorded, elapsed in sorted(latencies, key=lambda item: -item[2])[:top]:
+            print(f"  {elapsed * 1000:10.3f} мс (записано {recorded * 1000:10.3f} мс)  {command}")
+
+    busy = sum(elapsed for _, _, elapsed in latencies)
+    recorded = sum(recorded for _, recorded, _ in latencies)
+    print(f"\nКоманд: {len(latencies)}, время воспроизведения: {wall:.3f} с, "
+          f"выполнение: {busy:.3f} с (записано {recorded:.3f} с)")
+
+
+def parse_arguments():
+    options = {"log_path": None, "vfs_path": None, "paced": False, "speed": 1.0,
+               "top": 10, "out": None, "transcript": None}
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--vfs" and i + 1 < len(sys.argv):
+            options["vfs_path"] = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--paced":
+            options["paced"] = True
+            i += 1
+        elif sys.argv[i] == "--speed" and i + 1 < len(sys.argv):
+            options["paced"] = True
+            options["speed"] = float(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--top" and i + 1 < len(sys.argv):
+            options["top"] = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--out" and i + 1 < len(sys.argv):
+            options["out"] = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--transcript" and i + 1 < len(sys.argv):
+            options["transcript"] = sys.argv[i + 1]
+            i += 2
+        else:
+            options["log_path"] = sys.argv[i]
+            i += 1
+
+    return options
+
+
+def main():
+    """Воспроизведение журнала practice1.4.py --record без интерфейса
+
+    vfs_replay.py LOG [--vfs IMAGE.xml] [--paced | --speed F] [--top N]
+                  [--out RESULT.json] [--transcript OUT.txt]
+    По умолчанию команды идут подряд на полной скорости; образ берется из
+    заголовка журнала, --vfs его заменяет. RESULT.json сравнивается между
+    ревизиями через vfs_bench.py compare.
+    """
+    options = parse_arguments()
+    if not options["log_path"]:
+        print("Использование: vfs_replay.py LOG [--vfs IMAGE.xml] [--paced | --speed F] [--top N] "
+              "[--out RESULT.json] [--transcript OUT.txt]")
+        sys.exit(2)
+
+    try:
+        header, entries = read_log(options["log_path"])
+        vfs_path = options["vfs_path"] or header["vfs_path"] or None
+        transcript = open(options["transcript"], "w", encoding="utf-8") if options["transcript"] else None
+        try:
+            latencies, wall = replay(entries, vfs_path, options["paced"], options["speed"], transcript)
+        finally:
+            if transcript:
+                transcript.close()
+    except (OSError, ValueError) as e:
+        print(f"Ошибка: {e}")
+        sys.exit(1)
+
+    if not latencies:
+        print("Журнал пуст")
+        return
+
+    results = summarize(latencies)
+    print(f"Журнал: {options['log_path']} (записан {header['started']}), образ: {vfs_path or 'vfs-init'}")
+    print_report(results, latencies, wall, options["top"])
+
+    if options["out"]:
+        with open(options["out"], "w", encoding="utf-8") as f:
+            json.dump({"label": options["log_path"], "image": vfs_path, "paced": options["paced"],
+                       "wall": wall, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены: {options['out']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import gc
+import os
+import sys
+import tempfile
+import time
+
+from vfs_module import load_emulator
+
+
+# Коды завершения сценария
+STATUS_OK = 0
+STATUS_ERRORS = 1
+STATUS_CRASHED = 2
+
+
+def collect_scripts(paths):
+    """Файлы сценариев из аргументов; директория дает все свои файлы по имени"""
+    scripts = []
+    for path in paths:
+        if os.path.isdir(path):
+            scripts.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                           if os.path.isfile(os.path.join(path, name)))
+        else:
+            scripts.append(path)
+    return scripts
+
+
+def read_commands(script_path):
+    """Команды сценария без пустых строк и комментариев"""
+    with open(script_path, "r", encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+def run_script(emulator, vfs, script_path, out):
+    """Выполнить сценарий в отдельном сеансе и вернуть код завершения
+
+    Вывод повторяет окно терминала: приглашение, команда, ее результат.
+    Сценарий завершается с ошибкой, если хотя бы одна команда сообщила об ошибке.
+    """
+    session = emulator.ShellSession(vfs, stats=emulator.CommandStats())
+    status = STATUS_OK
+    for command in read_commands(script_path):
+        out.write(f"{session.cwd}$ {command}\n")
+        if command.split()[0].lower() == "exit":
+            break
+        result = session.execute(command)
+        if result:
+            out.write(f"{result}\n")
+            if emulator.first_error(result):
+                status = STATUS_ERRORS
+    return status
+
+
+def output_path(out_dir, index, script_path):
+    return os.path.join(out_dir, f"{index:04d}_{os.path.basename(script_path)}.out")
+
+
+def execute_to_file(emulator, vfs, script_path, path):
+    """Выполнить сценарий с выводом в файл; исключение дает STATUS_CRASHED"""
+    with open(path, "w", encoding="utf-8") as out:
+        try:
+            return run_script(emulator, vfs, script_path, out)
+        except Exception as e:
+            out.write(f"Ошибка выполнения скрипта: {e}\n")
+            return STATUS_CRASHED
+
+
+def run_forked(emulator, vfs, scripts, jobs, out_dir):
+    """Один дочерний процесс на сценарий, не больше jobs одновременно
+
+    Дерево загружено до fork и делится страницами copy-on-write: изменения
+    сценария видит только его процесс. gc.freeze() убирает объекты образа
+    из поколений сборщика, чтобы его проходы в дочерних процессах не
+    копировали страницы дерева.
+    """
+    gc.collect()
+    gc.freeze()
+    results = [None] * len(scripts)
+    running = {}
+    queue = iter(enumerate(scripts))
+    exhausted = False
+
+    while running or not exhausted:
+        while not exhausted and len(running) < jobs:
+            item = next(queue, None)
+            if item is None:
+                exhausted = True
+                break
+            index, script_path = item
+            started = time.perf_counter()
+            pid = os.fork()
+            if pid == 0:
+                status = STATUS_CRASHED
+                try:
+                    status = execute_to_file(emulator, vfs, script_path,
+                                             output_path(out_dir, index, script_path))
+                finally:
+                    os._exit(status)
+            running[pid] = (index, started)
+
+        if running:
+            pid, wait_status = os.wait()
+            index, started = running.pop(pid)
+            results[index] = (os.waitstatus_to_exitcode(wait_status), time.perf_counter() - started)
+
+    gc.unfreeze()
+    return results
+
+
+def run_sequential(emulator, vfs_path, scripts, out_dir):
+    """Базовый режим: каждый сценарий по очереди на заново загруженном образе,
+    как при отдельном запуске practice1.4.py --vfs ... --script ..."""
+    results = []
+    for index, script_path in enumerate(scripts):
+        started = time.perf_counter()
+        vfs = emulator.VFS()
+        success, message = vfs.load_from_xml(vfs_path)
+        path = output_path(out_dir, index, script_path)
+        if success:
+            status = execute_to_file(emulator, vfs, script_path, path)
+        else:
+            with open(path, "w", encoding="utf-8") as out:
+                out.write(f"Ошибка загрузки VFS: {message}\n")
+            status = STATUS_CRASHED
+        results.append((status, time.perf_counter() - started))
+    return results
+
+
+def first_error_in(path):
+    """Первая строка с ошибкой в файле вывода сценария"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return load_emulator().first_error(f.read()) or ""
+    except OSError:
+        return ""
+
+
+def print_summary(scripts, results, out_dir, elapsed, verbose):
+    failed = 0
+    for index, (script_path, (status, duration)) in enumerate(zip(scripts, results)):
+        if status == STATUS_OK:
+            if verbose:
+                print(f"[ OK ] {script_path} {duration:.3f} с")
+            continue
+        failed += 1
+        label = "FAIL" if status == STATUS_ERRORS else f"E{status:03d}"
+        print(f"[{label}] {script_path} {duration:.3f} с  {first_error_in(output_path(out_dir, index, script_path))}")
+
+    print(f"Сценариев: {len(scripts)}, успешно: {len(scripts) - failed}, с ошибками: {failed}; "
+          f"время: {elapsed:.3f} с ({len(scripts) / elapsed:.1f} сценариев/с)")
+    print(f"Вывод сценариев: {out_dir}")
+    return failed
+
+
+def parse_arguments():
+    options = {"vfs_path": None, "jobs": os.cpu_count() or 1, "out_dir": None,
+               "sequential": False, "verbose": False, "paths": []}
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--vfs" and i + 1 < len(sys.argv):
+            options["vfs_path"] = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] in ("--jobs", "-j") and i + 1 < len(sys.argv):
+            options["jobs"] = max(1, int(sys.argv[i + 1]))
+            i += 2
+        elif sys.argv[i] == "--out" and i + 1 < len(sys.argv):
+            options["out_dir"] = sys.argv[i + 1]
+            i += 2
+        elif sys.argv[i] == "--sequential":
+            options["sequential"] = True
+            i += 1
+        elif sys.argv[i] in ("--verbose", "-v"):
+            options["verbose"] = True
+            i += 1
+        else:
+            options["paths"].append(sys.argv[i])
+            i += 1
+
+    return options
+
+
+def run_suite(vfs_path, scripts, jobs, out_dir, sequential=False):
+    """Выполнить набор сценариев; вернуть (результаты, время)"""
+    emulator = load_emulator()
+    started = time.perf_counter()
+    if sequential:
+        results = run_sequential(emulator, vfs_path, scripts, out_dir)
+    else:
+        vfs = emulator.VFS()
+        if vfs_path:
+            success, message = vfs.load_from_xml(vfs_path)
+            if not success:
+                raise ValueError(f"Ошибка загрузки VFS: {message}")
+        else:
+            vfs.vfs_init()
+        results = run_forked(emulator, vfs, scripts, jobs, out_dir)
+    return results, time.perf_counter() - started
+
+
+def main():
+    """Параллельный запуск сценариев над одним загруженным образом VFS
+
+    vfs_runner.py --vfs IMAGE.xml [--jobs N] [--out DIR] [--sequential] [-v] SCRIPT|DIR...
+    Код завершения 1, если хотя бы один сценарий завершился с ошибкой.
+    """
+    options = parse_arguments()
+    scripts = collect_scripts(options["paths"])
+    if not scripts:
+        print("Использование: vfs_runner.py --vfs IMAGE.xml [--jobs N] [--out DIR] "
+              "[--sequential] [-v] SCRIPT|DIR...")
+        sys.exit(2)
+    if options["sequential"] and not options["vfs_path"]:
+        print("Ошибка: для --sequential нужен образ --vfs")
+        sys.exit(2)
+    if not options["sequential"] and not hasattr(os, "fork"):
+        print("Ошибка: параллельный запуск требует os.fork; используйте --sequential")
+        sys.exit(2)
+
+    out_dir = options["out_dir"] or tempfile.mkdtemp(prefix="vfs_runner_")
+    os.makedirs(out_dir, exist_ok=True)
+
+    try:
+        results, elapsed = run_suite(options["vfs_path"], scripts, options["jobs"], out_dir,
+                                     options["sequential"])
+    except ValueError as e:
+        print(e)
+        sys.exit(2)
+
+    failed = print_summary(scripts, results, out_dir, elapsed, options["verbose"])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
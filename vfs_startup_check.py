@@ -0,0 +1,72 @@
+import os
+import subprocess
+import sys
+import time
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Бюджеты холодного старта (с запасом относительно измерений на рабочей машине)
+IMPORT_BUDGET_MS = 20.0
+STARTUP_BUDGET_S = 0.5
+
+
+def import_cost_ms():
+    """Время импорта модулей эмулятора по python -X importtime сверх голого интерпретатора"""
+
+    def total(code):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                                cwd=HERE, capture_output=True, text=True, check=True)
+        modules = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, _, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = int(self_us)
+        return modules
+
+    bare = total("pass")
+    loaded = total("import vfs_module; vfs_module.load_emulator()")
+    extra = {name: us for name, us in loaded.items() if name not in bare}
+    return sum(extra.values()) / 1000, sorted(extra.items(), key=lambda item: -item[1])[:8]
+
+
+def time_to_prompt(extra_args, runs):
+    """Лучшее из нескольких измерений: от запуска процесса до готового приглашения"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(HERE, "practice1.4.py"), "--startup-probe"] + extra_args,
+                       cwd=HERE, capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    """Регрессионная проверка холодного старта; код возврата 1 при превышении бюджета
+
+    Дополнительные аргументы передаются эмулятору (например, --vfs образ.xml).
+    """
+    extra_args = sys.argv[1:]
+    failures = []
+
+    import_ms, heaviest = import_cost_ms()
+    print(f"Импорт модулей эмулятора: {import_ms:.1f} мс (бюджет {IMPORT_BUDGET_MS:.0f} мс)")
+    for name, us in heaviest:
+        print(f"  {name:<30} {us / 1000:6.2f} мс")
+    if import_ms > IMPORT_BUDGET_MS:
+        failures.append("импорт")
+
+    startup = time_to_prompt(extra_args, runs=5)
+    print(f"Время до приглашения: {startup * 1000:.0f} мс (бюджет {STARTUP_BUDGET_S * 1000:.0f} мс)")
+    if startup > STARTUP_BUDGET_S:
+        failures.append("время до приглашения")
+
+    if failures:
+        print(f"Превышен бюджет: {', '.join(failures)}")
+        sys.exit(1)
+    print("Бюджеты холодного старта соблюдены")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from vfs_module import load_emulator
+
+
+READ_COMMANDS = [
+    "ls /",
+    "ls /tmp",
+    "pwd",
+    "cd /home/user/documents",
+    "cd ..",
+    "wc /etc/config.txt /home/user/documents/readme.txt",
+    "find -name *.txt",
+    "du -s /",
+    "vfs-diff /etc /tmp",
+    "search hello",
+    "tail -n 2 /etc/config.txt",
+    "wc -l /home/user/documents/readme.txt",
+]
+
+
+# Доли пакетов записи внутри begin/commit и begin/rollback
+TRANSACTION_RATIO = 0.2
+ROLLBACK_RATIO = 0.1
+
+
+def write_commands(worker, step):
+    """Изменения, которые конфликтуют с чтениями и между потоками"""
+    name = f"/tmp/w{worker}_{step}"
+    return [
+        f"mkdir {name}",
+        f"cp /etc {name}/etc",
+        f"mv {name}/etc {name}/etc_moved",
+        f"cp /home/user/documents/readme.txt {name}/readme.txt",
+        f"mv {name} /tmp/done_w{worker}_{step}",
+    ]
+
+
+def verify_tree(vfs):
+    """Проверка инвариантов: ссылки на родителя, отсутствие циклов, агрегаты du, порядок имен"""
+    errors = []
+    seen = set()
+
+    def check(node, parent, path):
+        if id(node) in seen:
+            errors.append(f"{path}: узел встречается в дереве дважды")
+            return 0, 0, 0
+        seen.add(id(node))
+
+        if node['parent'] is not parent:
+            errors.append(f"{path}: неверная ссылка на родителя")
+        if node['type'] == 'file':
+            return node['size'], 1, 0
+
+        if node['order'] != sorted(node['children']):
+            errors.append(f"{path or '/'}: порядок имен не совпадает с детьми")
+
+        size = files = dirs = 0
+        for name, child in node['children'].items():
+            if child['name'] != name:
+                errors.append(f"{path}/{name}: имя узла '{child['name']}' не совпадает с ключом")
+            child_size, child_files, child_dirs = check(child, node, f"{path}/{name}")
+            size += child_size
+            files += child_files
+            dirs += child_dirs + (1 if child['type'] == 'directory' else 0)
+
+        if (size, files, dirs) != (node['total_size'], node['file_count'], node['dir_count']):
+            errors.append(f"{path or '/'}: агрегаты {node['total_size']}/{node['file_count']}/"
+                          f"{node['dir_count']}, ожидалось {size}/{files}/{dirs}")
+        return size, files, dirs
+
+    check(vfs.root, None, "")
+    errors.extend(verify_hashes(vfs))
+    errors.extend(verify_index(vfs))
+    return errors
+
+
+def verify_index(vfs):
+    """Индекс, обновляемый по событиям шины, должен совпадать с построенным заново"""
+    if vfs.text_index is None:
+        return []
+    fresh = type(vfs.text_index)(vfs.read_content)
+    fresh.add_tree(vfs.root)
+    index = vfs.text_index
+    errors = [f"индекс: слово '{token}' в лишних или недостающих документах"
+              for token in set(index.postings) | set(fresh.postings)
+              if set(index.postings.get(token, ())) != set(fresh.postings.get(token, ()))]
+    for key in set(index.documents) | set(fresh.documents):
+        indexed = set(index.documents[key][1]) if key in index.documents else set()
+        expected = set(fresh.documents[key][1]) if key in fresh.documents else set()
+        if indexed != expected:
+            errors.append(f"индекс: документ {key}: файлов {len(indexed)}, ожидалось {len(expected)}")
+    return errors
+
+
+def verify_hashes(vfs):
+    """Кэшированные хеши Меркла должны совпадать с вычисленными заново"""
+    cached = []
+    stack = [(vfs.root, "")]
+    while stack:
+        node, path = stack.pop()
+        if 'hash' in node:
+            cached.append((node, path, node.pop('hash')))
+        if node['type'] == 'directory':
+            stack.extend((child, f"{path}/{name}") for name, child in node['children'].items())
+    return [f"{path or '/'}: устаревший хеш Меркла" for node, path, digest in cached
+            if vfs.tree_hash(node) != digest]
+
+
+def verify_diff(module):
+    """vfs-diff должен видеть правку содержимого глубоко в образе, отредактированном
+    вручную: хеши из атрибутов XML при сравнении не используются"""
+    vfs = module.VFS()
+    vfs.vfs_init()
+    session = module.ShellSession(vfs)
+    with tempfile.TemporaryDirectory() as workdir:
+        original = os.path.join(workdir, "a.xml")
+        edited = os.path.join(workdir, "b.xml")
+        session.execute(f"vfs-export {original}")
+        with open(original, encoding="utf-8") as f:
+            text = f.read()
+        with open(edited, "w", encoding="utf-8") as f:
+            f.write(text.replace("Третья строка.", "Третья строка, исправленная."))
+        result = session.execute(f"vfs-diff {original} {edited}")
+    if not result.startswith("M /home/user/documents/readme.txt"):
+        return [f"vfs-diff не заметил правку /home/user/documents/readme.txt: {result}"]
+    return []
+
+
+def worker(module, vfs, index, duration, write_ratio, counters, failures):
+    session = module.ShellSession(vfs)
+    rng = random.Random(index)
+    reads = writes = step = 0
+    deadline = time.perf_counter() + duration
+
+    while time.perf_counter() < deadline:
+        try:
+            if rng.random() < write_ratio:
+                commands = write_commands(index, step)
+                mode = rng.random()
+                if mode < TRANSACTION_RATIO:
+                    # Пока транзакция открыта, остальные сеансы получают отказ
+                    commands = ["begin"] + commands + ["du -s /", "commit"]
+                elif mode < TRANSACTION_RATIO + ROLLBACK_RATIO:
+                    commands = ["begin"] + commands + ["du -s /", "rollback"]
+                for command in commands:
+                    session.execute(command)
+                    writes += 1
+                step += 1
+            else:
+                session.execute(rng.choice(READ_COMMANDS))
+                reads += 1
+        except Exception as e:
+            failures.append(f"поток {index}: {type(e).__name__}: {e}")
+            break
+
+    counters[index] = (reads, writes)
+
+
+def parse_arguments():
+    threads = 16
+    duration = 5.0
+    write_ratio = 0.1
+
+    i = 1
+    while i < len(sys.argv):
+        if sys.argv[i] == "--threads" and i + 1 < len(sys.argv):
+            threads = int(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--duration" and i + 1 < len(sys.argv):
+            duration = float(sys.argv[i + 1])
+            i += 2
+        elif sys.argv[i] == "--write-ratio" and i + 1 < len(sys.argv):
+            write_ratio = float(sys.argv[i + 1])
+            i += 2
+        else:
+            i += 1
+
+    return threads, duration, write_ratio
+
+
+def main():
+    """Стресс-тест блокировок VFS: чтения и записи из многих потоков
+
+    Завершается с кодом 1, если нарушены инварианты дерева или поток упал.
+    """
+    threads, duration, write_ratio = parse_arguments()
+    module = load_emulator()
+    vfs = module.VFS()
+    vfs.vfs_init()
+
+    counters = {}
+    failures = []
+    pool = [
+        threading.Thread(target=worker, args=(module, vfs, i, duration, write_ratio, counters, failures))
+        for i in range(threads)
+    ]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    reads = sum(r for r, _ in counters.values())
+    writes = sum(w for _, w in counters.values())
+    print(f"Потоков: {threads}, время: {elapsed:.2f} с")
+    print(f"Чтений: {reads} ({reads / elapsed:.0f}/с), записей: {writes} ({writes / elapsed:.0f}/с)")
+
+    errors = failures + verify_tree(vfs) + verify_diff(module)
+    if errors:
+        print(f"Обнаружено ошибок: {len(errors)}")
+        for error in errors[:20]:
+            print(f"  {error}")
+        sys.exit(1)
+    print("Инварианты дерева соблюдены")
+
+
+if __name__ == "__main__":
+    main()